@@ -1,10 +1,13 @@
 import json
-import os
-import hashlib
-import secrets
 import psycopg2
 from datetime import datetime, timedelta
 
+from db import pool
+from provisioning import REGISTER_SQL, hash_password
+from timing import dumps, instrumented
+from tokens import bearer_token, issue_token, secret_configured, verify_token
+
+@instrumented('auth', extra=pool.stats)
 def handler(event: dict, context) -> dict:
     '''API для регистрации и авторизации пользователей'''
     
@@ -16,19 +19,29 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
             },
             'body': ''
         }
     
+    conn = None
+    cur = None
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = pool.getconn()
         cur = conn.cursor()
         
         if method == 'POST':
             body = json.loads(event.get('body', '{}'))
             action = body.get('action')
             
+            # Без ключа подписи токен не выдать и не проверить: отказываем до записи в базу
+            if action in ('register', 'login', 'logout') and not secret_configured():
+                return {
+                    'statusCode': 503,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'error': 'Авторизация не настроена: не задан SESSION_SECRET'})
+                }
+            
             if action == 'register':
                 email = body.get('email')
                 password = body.get('password')
@@ -38,48 +51,23 @@ def handler(event: dict, context) -> dict:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Email и пароль обязательны'})
+                        'body': dumps({'error': 'Email и пароль обязательны'})
                     }
                 
-                password_hash = hashlib.sha256(password.encode()).hexdigest()
-                
                 try:
                     cur.execute(
-                        "INSERT INTO users (email, password_hash, username) VALUES (%s, %s, %s) RETURNING id, email, username, level, coins, xp",
-                        (email, password_hash, username)
+                        REGISTER_SQL,
+                        {'email': email, 'password_hash': hash_password(password), 'username': username}
                     )
                     user_data = cur.fetchone()
-                    
-                    cur.execute(
-                        "INSERT INTO pets (user_id, name, pet_type, level, xp, hunger, happiness, health, energy) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
-                        (user_data[0], 'Дружок', 'dog', 1, 0, 75, 80, 90, 65)
-                    )
-                    
-                    achievements = ['Первый друг', 'Заботливый', 'Богач']
-                    for ach in achievements:
-                        completed = ach == 'Первый друг'
-                        cur.execute(
-                            "INSERT INTO user_achievements (user_id, achievement_name, completed, completed_at) VALUES (%s, %s, %s, %s)",
-                            (user_data[0], ach, completed, datetime.now() if completed else None)
-                        )
-                    
-                    cur.execute(
-                        "INSERT INTO user_quests (user_id, quest_name, progress, goal, reward) VALUES (%s, %s, %s, %s, %s)",
-                        (user_data[0], 'Покорми питомца 3 раза', 0, 3, 50)
-                    )
-                    cur.execute(
-                        "INSERT INTO user_quests (user_id, quest_name, progress, goal, reward) VALUES (%s, %s, %s, %s, %s)",
-                        (user_data[0], 'Поиграй 5 раз', 0, 5, 75)
-                    )
+                    token = issue_token(user_data[0])
                     
                     conn.commit()
                     
-                    token = secrets.token_urlsafe(32)
-                    
                     return {
                         'statusCode': 200,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({
+                        'body': dumps({
                             'success': True,
                             'token': token,
                             'user': {
@@ -97,7 +85,7 @@ def handler(event: dict, context) -> dict:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Пользователь с таким email уже существует'})
+                        'body': dumps({'error': 'Пользователь с таким email уже существует'})
                     }
             
             elif action == 'login':
@@ -108,10 +96,10 @@ def handler(event: dict, context) -> dict:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Email и пароль обязательны'})
+                        'body': dumps({'error': 'Email и пароль обязательны'})
                     }
                 
-                password_hash = hashlib.sha256(password.encode()).hexdigest()
+                password_hash = hash_password(password)
                 
                 cur.execute(
                     "SELECT id, email, username, level, coins, xp, password_hash FROM users WHERE email = %s",
@@ -123,18 +111,17 @@ def handler(event: dict, context) -> dict:
                     return {
                         'statusCode': 401,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Неверный email или пароль'})
+                        'body': dumps({'error': 'Неверный email или пароль'})
                     }
                 
                 cur.execute("UPDATE users SET last_login = %s WHERE id = %s", (datetime.now(), user[0]))
+                token = issue_token(user[0])
                 conn.commit()
                 
-                token = secrets.token_urlsafe(32)
-                
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
+                    'body': dumps({
                         'success': True,
                         'token': token,
                         'user': {
@@ -147,21 +134,45 @@ def handler(event: dict, context) -> dict:
                         }
                     })
                 }
+            
+            elif action == 'logout':
+                headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+                token = body.get('token') or bearer_token(headers.get('authorization'))
+                claims = verify_token(token) if token else None
+                
+                if not claims:
+                    return {
+                        'statusCode': 401,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': dumps({'error': 'Недействительный токен'})
+                    }
+                
+                cur.execute(
+                    "INSERT INTO revoked_tokens (jti, user_id, expires_at) VALUES (%s, %s, %s) ON CONFLICT (jti) DO NOTHING",
+                    (claims['jti'], claims['uid'], datetime.fromtimestamp(claims['exp']))
+                )
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'success': True})
+                }
         
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Метод не поддерживается'})
+            'body': dumps({'error': 'Метод не поддерживается'})
         }
         
     except Exception as e:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'})
+            'body': dumps({'error': f'Ошибка сервера: {str(e)}'})
         }
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            pool.putconn(conn)
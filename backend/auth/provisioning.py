@@ -0,0 +1,57 @@
+'''Создание нового игрока одним запросом: пользователь, стартовый питомец, достижения, квесты
+
+Один и тот же шаблон используется при регистрации через API и при массовом импорте,
+поэтому стартовый набор игрока не расходится между этими путями.
+'''
+
+import hashlib
+
+STARTER_PET = {'name': 'Дружок', 'pet_type': 'dog', 'level': 1, 'xp': 0, 'hunger': 75, 'happiness': 80, 'health': 90, 'energy': 65}
+
+STARTER_ACHIEVEMENTS = ['Первый друг', 'Заботливый', 'Богач']
+
+# Достижение, которое засчитывается сразу при создании аккаунта
+GRANTED_ACHIEVEMENT = 'Первый друг'
+
+USER_COLUMNS = 'id, email, username, level, coins, xp'
+
+
+def hash_password(password: str) -> str:
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def provision_sql(insert_users: str, select: str = USER_COLUMNS) -> str:
+    '''Оборачивает INSERT INTO users в CTE, досоздающие всё остальное для новых строк
+
+    insert_users — INSERT без RETURNING; в итоговый SELECT попадают только реально
+    вставленные пользователи.
+    '''
+    pet = STARTER_PET
+    achievements = ', '.join(f"('{name}')" for name in STARTER_ACHIEVEMENTS)
+    return f"""
+        WITH new_user AS (
+            {insert_users}
+            RETURNING {USER_COLUMNS}
+        ), pet AS (
+            INSERT INTO pets (user_id, name, pet_type, level, xp, hunger, happiness, health, energy)
+            SELECT id, '{pet['name']}', '{pet['pet_type']}', {pet['level']}, {pet['xp']},
+                   {pet['hunger']}, {pet['happiness']}, {pet['health']}, {pet['energy']}
+            FROM new_user
+        ), achievements AS (
+            INSERT INTO user_achievements (user_id, achievement_name, completed, completed_at)
+            SELECT u.id, a.name, a.name = '{GRANTED_ACHIEVEMENT}',
+                   CASE WHEN a.name = '{GRANTED_ACHIEVEMENT}' THEN LOCALTIMESTAMP END
+            FROM new_user u CROSS JOIN (VALUES {achievements}) AS a(name)
+        ), quests AS (
+            INSERT INTO user_quests (user_id, quest_id, action_key, quest_name, progress, goal, reward)
+            SELECT u.id, d.id, d.action_key, d.quest_name, 0, d.goal, d.reward
+            FROM new_user u CROSS JOIN quest_definitions d
+            WHERE d.active = TRUE
+        )
+        SELECT {select} FROM new_user
+    """
+
+
+REGISTER_SQL = provision_sql(
+    "INSERT INTO users (email, password_hash, username) VALUES (%(email)s, %(password_hash)s, %(username)s)"
+)
@@ -5,19 +5,36 @@ Unisender Go Extension - Transactional Emails
 Подтверждения заказов, сброс пароля, уведомления и т.д.
 """
 
+import hmac
 import json
 import os
 from datetime import datetime
 from typing import Optional
 
+import psycopg2
 import requests
+from requests.adapters import HTTPAdapter
+
+from db import PoolExhausted
+from outbox import drain, enqueue
+from templates import TEMPLATES, render_template
+from timing import dumps, instrumented, phase
 
 
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
-UNISENDER_GO_API_URL = "https://go2.unisender.ru/ru/transactional/api/v1"
+UNISENDER_GO_API_URL = os.environ.get(
+    "UNISENDER_GO_API_URL", "https://go2.unisender.ru/ru/transactional/api/v1"
+)
+
+# Outbox failures answered with 503: database down, pool exhausted, DATABASE_URL missing
+OUTBOX_ERRORS = (psycopg2.Error, PoolExhausted, KeyError)
+
+# Unisender Go accepts at most 500 recipients per email/send.json call
+MAX_RECIPIENTS_PER_MESSAGE = 500
+MAX_BATCH_RECIPIENTS = int(os.environ.get("UNISENDER_MAX_BATCH_RECIPIENTS", "10000"))
 
 
 def get_api_key() -> str:
@@ -55,7 +72,7 @@ def cors_response(status: int, body: dict) -> dict:
     return {
         "statusCode": status,
         "headers": {**get_cors_headers(), "Content-Type": "application/json"},
-        "body": json.dumps(body),
+        "body": dumps(body),
     }
 
 
@@ -71,7 +88,7 @@ def options_response() -> dict:
 # UNISENDER GO API
 # =============================================================================
 
-def send_email(
+def build_message(
     to_email: str,
     subject: str,
     body_html: str,
@@ -85,7 +102,7 @@ def send_email(
     track_read: bool = True,
 ) -> dict:
     """
-    Send transactional email via Unisender Go.
+    Build an email/send.json message for one recipient.
 
     Args:
         to_email: Recipient email
@@ -100,7 +117,7 @@ def send_email(
         track_links: Track link clicks
         track_read: Track email opens
     """
-    api_key = get_api_key()
+    get_api_key()  # Fail before building the message when not configured
     sender_email = from_email or get_sender_email()
     sender_name = from_name or get_sender_name()
 
@@ -134,45 +151,184 @@ def send_email(
     if tags:
         message["tags"] = tags[:4]  # Max 4 tags
 
-    # Send request
+    return message
+
+
+def send_email(*args, **kwargs) -> dict:
+    """Send transactional email via Unisender Go right away (arguments as in build_message)."""
+    return post_message(build_message(*args, **kwargs))
+
+
+_session = None
+
+
+def get_session() -> requests.Session:
+    """Keep-alive session shared by all calls in a warm container."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        _session = session
+    return _session
+
+
+def post_message(message: dict) -> dict:
+    """POST one message to email/send.json over the shared session."""
+    api_key = get_api_key()
     try:
-        response = requests.post(
-            f"{UNISENDER_GO_API_URL}/email/send.json",
-            headers={
-                "Content-Type": "application/json",
-                "X-API-KEY": api_key,
-            },
-            json={"message": message},
-            timeout=30
-        )
-        return response.json()
+        with phase("upstream"):
+            response = get_session().post(
+                f"{UNISENDER_GO_API_URL}/email/send.json",
+                headers={
+                    "Content-Type": "application/json",
+                    "X-API-KEY": api_key,
+                },
+                json={"message": message},
+                timeout=30
+            )
+            return response.json()
     except requests.exceptions.Timeout:
         return {"status": "error", "message": "Unisender API timeout"}
     except requests.exceptions.ConnectionError:
         return {"status": "error", "message": "Unisender API unavailable"}
     except requests.exceptions.RequestException as e:
         return {"status": "error", "message": f"Request failed: {str(e)}"}
+    except ValueError:
+        return {"status": "error", "message": "Invalid Unisender API response"}
+
+
+def failed_recipients(result: dict) -> list:
+    """
+    Normalize failed_emails to [{"email": ..., "reason": ...}].
+
+    The API returns an {email: reason} object; older responses used a list of objects.
+    """
+    failed = result.get("failed_emails") or {}
+    if isinstance(failed, dict):
+        return [{"email": email, "reason": reason} for email, reason in failed.items()]
+    return [
+        {"email": item.get("email"), "reason": item.get("reason", "unknown")}
+        for item in failed
+    ]
+
+
+def send_batch(
+    recipients: list,
+    subject: str,
+    body_html: str,
+    from_email: Optional[str] = None,
+    from_name: Optional[str] = None,
+    template_id: Optional[str] = None,
+    global_substitutions: Optional[dict] = None,
+    tags: Optional[list] = None,
+    track_links: bool = True,
+    track_read: bool = True,
+    batch_size: int = MAX_RECIPIENTS_PER_MESSAGE,
+) -> list:
+    """
+    Send one message to many recipients, packing up to batch_size per API call.
+
+    Args:
+        recipients: [{"email": ..., "name": ..., "substitutions": {...}}]
+        global_substitutions: Variables shared by every recipient
+        batch_size: Recipients per API call (capped at MAX_RECIPIENTS_PER_MESSAGE)
+
+    Returns one report per API call:
+        {"batch": n, "recipients": count, "job_id": ..., "failed": [...], "error": ...}
+    """
+    sender_email = from_email or get_sender_email()
+    sender_name = from_name or get_sender_name()
+
+    if not sender_email:
+        raise ValueError("Sender email not configured")
+
+    message = {
+        "from_email": sender_email,
+        "subject": subject,
+        "track_links": 1 if track_links else 0,
+        "track_read": 1 if track_read else 0,
+    }
+    if sender_name:
+        message["from_name"] = sender_name
+    if template_id:
+        message["template_id"] = template_id
+    else:
+        message["body"] = {"html": body_html}
+    if global_substitutions:
+        message["global_substitutions"] = global_substitutions
+    if tags:
+        message["tags"] = tags[:4]  # Max 4 tags
+
+    batch_size = max(1, min(batch_size, MAX_RECIPIENTS_PER_MESSAGE))
+    reports = []
+    for start in range(0, len(recipients), batch_size):
+        chunk = recipients[start:start + batch_size]
+        result = post_message({**message, "recipients": chunk})
+        report = {
+            "batch": len(reports),
+            "recipients": len(chunk),
+            "job_id": result.get("job_id"),
+            "failed": failed_recipients(result),
+        }
+        if result.get("status") == "error":
+            # The whole call was rejected: every recipient of the batch failed
+            report["error"] = result.get("message", "Send failed")
+            report["failed"] = [
+                {"email": recipient["email"], "reason": report["error"]} for recipient in chunk
+            ]
+        reports.append(report)
+    return reports
 
 
 # =============================================================================
 # ACTION HANDLERS
 # =============================================================================
 
+def outbox_unavailable(error: Exception) -> dict:
+    print(json.dumps({"event": "outbox_unavailable", "error": f"{type(error).__name__}: {error}"}))
+    return cors_response(503, {"error": "Email outbox unavailable, try again later"})
+
+
+def queue_message(message: dict) -> dict:
+    """Store the message in the outbox and answer 202, or 503 when the outbox is down."""
+    try:
+        outbox_id = enqueue(message)
+    except OUTBOX_ERRORS as e:
+        return outbox_unavailable(e)
+    return cors_response(202, {
+        "success": True,
+        "queued": True,
+        "outbox_id": outbox_id,
+    })
+
+
 def handle_send(body: dict) -> dict:
     """
     POST ?action=send
-    Send transactional email.
+    Queue transactional email; the outbox drainer sends it.
     """
     to_email = body.get("to_email", "").strip()
     to_name = body.get("to_name", "").strip()
     subject = body.get("subject", "").strip()
     body_html = body.get("body_html", "").strip()
     template_id = body.get("template_id")
+    local_template = body.get("local_template")
     substitutions = body.get("substitutions", {})
     tags = body.get("tags", [])
     from_email = body.get("from_email")
     from_name = body.get("from_name")
 
+    if not isinstance(substitutions, dict):
+        return cors_response(400, {"error": "substitutions must be an object"})
+
+    if local_template:
+        if local_template not in TEMPLATES:
+            return cors_response(400, {"error": f"Unknown local_template: {local_template}"})
+        local_subject, body_html = render_template(local_template, substitutions)
+        subject = subject or local_subject
+        substitutions = {}
+
     # Validation
     if not to_email:
         return cors_response(400, {"error": "to_email is required"})
@@ -184,9 +340,9 @@ def handle_send(body: dict) -> dict:
         return cors_response(400, {"error": "subject is required"})
 
     if not body_html and not template_id:
-        return cors_response(400, {"error": "body_html or template_id is required"})
+        return cors_response(400, {"error": "body_html, template_id or local_template is required"})
 
-    result = send_email(
+    message = build_message(
         to_email=to_email,
         to_name=to_name if to_name else None,
         subject=subject,
@@ -198,25 +354,7 @@ def handle_send(body: dict) -> dict:
         from_name=from_name,
     )
 
-    # Check for errors
-    if "status" in result and result["status"] == "error":
-        return cors_response(400, {
-            "error": result.get("message", "Send failed"),
-            "code": result.get("code")
-        })
-
-    if "failed_emails" in result and result["failed_emails"]:
-        failed = result["failed_emails"][0]
-        return cors_response(400, {
-            "error": f"Email rejected: {failed.get('reason', 'unknown')}",
-            "email": failed.get("email")
-        })
-
-    return cors_response(200, {
-        "success": True,
-        "job_id": result.get("job_id"),
-        "emails": result.get("emails", [])
-    })
+    return queue_message(message)
 
 
 def handle_test(body: dict) -> dict:
@@ -232,27 +370,14 @@ def handle_test(body: dict) -> dict:
     if "@" not in to_email:
         return cors_response(400, {"error": "Invalid email format"})
 
+    subject, body_html = render_template("test", {
+        "sender_email": get_sender_email(),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
     result = send_email(
         to_email=to_email,
-        subject="Тестовое письмо от Unisender Go",
-        body_html="""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
-            <h1 style="color: #333;">Тестовое письмо</h1>
-            <p>Если вы видите это письмо — настройка Unisender Go прошла успешно!</p>
-            <p style="color: #666; font-size: 14px;">
-                Отправитель: {{sender_email}}<br>
-                Время: {{timestamp}}
-            </p>
-            <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
-            <p style="color: #999; font-size: 12px;">
-                Это автоматическое тестовое письмо. Отвечать на него не нужно.
-            </p>
-        </div>
-        """,
-        substitutions={
-            "sender_email": get_sender_email(),
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        },
+        subject=subject,
+        body_html=body_html,
         tags=["test"],
     )
 
@@ -262,8 +387,8 @@ def handle_test(body: dict) -> dict:
             "code": result.get("code")
         })
 
-    if "failed_emails" in result and result["failed_emails"]:
-        failed = result["failed_emails"][0]
+    if failed_recipients(result):
+        failed = failed_recipients(result)[0]
         return cors_response(400, {
             "error": f"Email rejected: {failed.get('reason', 'unknown')}",
         })
@@ -278,7 +403,7 @@ def handle_test(body: dict) -> dict:
 def handle_send_template(body: dict) -> dict:
     """
     POST ?action=send-template
-    Send email using saved template.
+    Queue email using saved template; the outbox drainer sends it.
     """
     to_email = body.get("to_email", "").strip()
     to_name = body.get("to_name", "").strip()
@@ -292,7 +417,7 @@ def handle_send_template(body: dict) -> dict:
     if not template_id:
         return cors_response(400, {"error": "template_id is required"})
 
-    result = send_email(
+    message = build_message(
         to_email=to_email,
         to_name=to_name if to_name else None,
         subject=subject or "Уведомление",
@@ -301,28 +426,116 @@ def handle_send_template(body: dict) -> dict:
         substitutions=substitutions if substitutions else None,
     )
 
-    if "status" in result and result["status"] == "error":
-        return cors_response(400, {
-            "error": result.get("message", "Send failed"),
-            "code": result.get("code")
-        })
+    return queue_message(message)
 
-    if "failed_emails" in result and result["failed_emails"]:
-        failed = result["failed_emails"][0]
-        return cors_response(400, {
-            "error": f"Email rejected: {failed.get('reason', 'unknown')}",
-        })
 
+def handle_send_batch(body: dict) -> dict:
+    """
+    POST ?action=send-batch
+    Send one message to many recipients with per-recipient substitutions.
+    """
+    raw_recipients = body.get("recipients") or []
+    subject = body.get("subject", "").strip()
+    body_html = body.get("body_html", "").strip()
+    template_id = body.get("template_id")
+    local_template = body.get("local_template")
+    global_substitutions = body.get("global_substitutions", {})
+    tags = body.get("tags", [])
+
+    # One body serves the whole message, so per-recipient values stay with the provider
+    if local_template:
+        if local_template not in TEMPLATES:
+            return cors_response(400, {"error": f"Unknown local_template: {local_template}"})
+        subject = subject or TEMPLATES[local_template]["subject"]
+        body_html = TEMPLATES[local_template]["html"]
+
+    if not isinstance(raw_recipients, list) or not raw_recipients:
+        return cors_response(400, {"error": "recipients is required"})
+
+    if len(raw_recipients) > MAX_BATCH_RECIPIENTS:
+        return cors_response(400, {"error": f"At most {MAX_BATCH_RECIPIENTS} recipients per request"})
+
+    if not subject:
+        return cors_response(400, {"error": "subject is required"})
+
+    if not body_html and not template_id:
+        return cors_response(400, {"error": "body_html or template_id is required"})
+
+    try:
+        batch_size = int(body.get("batch_size") or MAX_RECIPIENTS_PER_MESSAGE)
+    except (TypeError, ValueError):
+        return cors_response(400, {"error": "batch_size must be an integer"})
+    if batch_size < 1:
+        return cors_response(400, {"error": "batch_size must be positive"})
+
+    # Invalid addresses are reported without spending an API call on them
+    recipients = []
+    invalid = []
+    for item in raw_recipients:
+        email = (item.get("email") or "").strip() if isinstance(item, dict) else ""
+        if "@" not in email:
+            invalid.append({"email": email or None, "reason": "Invalid email format"})
+            continue
+        recipient = {"email": email}
+        if item.get("name"):
+            recipient["name"] = item["name"]
+        if item.get("substitutions"):
+            recipient["substitutions"] = item["substitutions"]
+        recipients.append(recipient)
+
+    batches = send_batch(
+        recipients,
+        subject=subject,
+        body_html=body_html,
+        template_id=template_id,
+        global_substitutions=global_substitutions if global_substitutions else None,
+        tags=tags if tags else None,
+        from_email=body.get("from_email"),
+        from_name=body.get("from_name"),
+        batch_size=batch_size,
+    )
+
+    failed = invalid + [item for batch in batches for item in batch["failed"]]
     return cors_response(200, {
-        "success": True,
-        "job_id": result.get("job_id"),
+        "success": not failed,
+        "sent": len(raw_recipients) - len(failed),
+        "failed": failed,
+        "batches": batches,
     })
 
 
+def handle_drain(event: dict, body: dict) -> dict:
+    """
+    POST ?action=drain
+    Send due outbox messages; meant for a scheduled trigger.
+    """
+    drain_token = os.environ.get("OUTBOX_DRAIN_TOKEN", "")
+    if not drain_token:
+        return cors_response(503, {"error": "OUTBOX_DRAIN_TOKEN not configured"})
+    headers = {key.lower(): value for key, value in (event.get("headers") or {}).items()}
+    if not hmac.compare_digest((headers.get("x-drain-token") or "").encode(), drain_token.encode()):
+        return cors_response(403, {"error": "Invalid drain token"})
+
+    try:
+        batch_size = int(body.get("batch_size") or 20)
+        time_budget = float(body.get("time_budget") or 20)
+    except (TypeError, ValueError):
+        return cors_response(400, {"error": "batch_size and time_budget must be numbers"})
+    if batch_size < 1 or time_budget <= 0:
+        return cors_response(400, {"error": "batch_size and time_budget must be positive"})
+
+    try:
+        stats = drain(post_message, batch_size=batch_size, time_budget=time_budget)
+    except OUTBOX_ERRORS as e:
+        return outbox_unavailable(e)
+    return cors_response(200, {"success": True, **stats})
+
+
 # =============================================================================
 # MAIN HANDLER
 # =============================================================================
 
+@instrumented("unisender")
 def handler(event: dict, context) -> dict:
     """Main entry point."""
     method = event.get("httpMethod", "GET")
@@ -345,6 +558,10 @@ def handler(event: dict, context) -> dict:
         return handle_send(body)
     elif action == "send-template" and method == "POST":
         return handle_send_template(body)
+    elif action == "send-batch" and method == "POST":
+        return handle_send_batch(body)
+    elif action == "drain" and method == "POST":
+        return handle_drain(event, body)
     elif action == "test" and method == "POST":
         return handle_test(body)
     else:
@@ -0,0 +1,167 @@
+"""
+Durable email outbox on Postgres.
+
+Send actions insert the prepared message and return at once. Drainers claim due rows
+with FOR UPDATE SKIP LOCKED in a short transaction, marking them 'sending' with a
+lease (next_attempt_at = now + lease), and only then call the API outside any
+transaction. Parallel drainers therefore never pick the same row; a drainer that dies
+mid-send lets its lease expire and the row is claimed again.
+
+Failed sends, including exceptions raised by the send function, are retried with
+exponential backoff and jitter; after OUTBOX_MAX_ATTEMPTS the row moves to the 'dead'
+state for manual inspection. A message whose every recipient was rejected goes to
+'dead' at once, since resending to the same addresses cannot succeed. The time budget
+is checked before every message, and claimed rows left unsent when it runs out are
+released at once instead of waiting for their lease.
+"""
+
+import json
+import os
+import random
+import time
+
+from db import pool
+
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BASE_DELAY = float(os.environ.get("OUTBOX_BASE_DELAY", "30"))
+OUTBOX_MAX_DELAY = float(os.environ.get("OUTBOX_MAX_DELAY", "3600"))
+OUTBOX_LEASE = int(os.environ.get("OUTBOX_LEASE", "60"))
+
+# Matches the request timeout in post_message: a claim must outlive a batch of slow sends
+SEND_TIMEOUT = 30
+
+ENQUEUE_SQL = "INSERT INTO email_outbox (message) VALUES (%s) RETURNING id"
+
+CLAIM_SQL = """
+    UPDATE email_outbox o SET
+        status = 'sending',
+        attempts = o.attempts + 1,
+        next_attempt_at = LOCALTIMESTAMP + make_interval(secs => %(lease)s)
+    FROM (
+        SELECT id FROM email_outbox
+        WHERE status IN ('pending', 'sending') AND next_attempt_at <= LOCALTIMESTAMP
+        ORDER BY next_attempt_at
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE o.id = due.id
+    RETURNING o.id, o.message, o.attempts
+"""
+
+# Outcomes are written back in one statement per batch; each row carries its own
+# new status, delay and error. The attempts check skips rows whose lease expired and
+# which another drainer has claimed since.
+FINISH_SQL = """
+    UPDATE email_outbox o SET
+        status = r.status,
+        job_id = COALESCE(r.job_id, o.job_id),
+        last_error = r.error,
+        sent_at = CASE WHEN r.status = 'sent' THEN LOCALTIMESTAMP ELSE o.sent_at END,
+        next_attempt_at = LOCALTIMESTAMP + make_interval(secs => r.delay)
+    FROM unnest(%(ids)s::BIGINT[], %(attempts)s::INTEGER[], %(statuses)s::TEXT[], %(job_ids)s::TEXT[],
+                %(errors)s::TEXT[], %(delays)s::FLOAT8[]) AS r(id, attempts, status, job_id, error, delay)
+    WHERE o.id = r.id AND o.status = 'sending' AND o.attempts = r.attempts
+"""
+
+# Claimed but not attempted: back to pending without spending an attempt
+RELEASE_SQL = """
+    UPDATE email_outbox o SET
+        status = 'pending',
+        attempts = o.attempts - 1,
+        next_attempt_at = LOCALTIMESTAMP
+    FROM unnest(%(ids)s::BIGINT[], %(attempts)s::INTEGER[]) AS r(id, attempts)
+    WHERE o.id = r.id AND o.status = 'sending' AND o.attempts = r.attempts
+"""
+
+
+def enqueue(message: dict) -> int:
+    """Store a prepared email/send.json message; returns the outbox id."""
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(ENQUEUE_SQL, (json.dumps(message),))
+            outbox_id = cur.fetchone()[0]
+        conn.commit()
+        return outbox_id
+    finally:
+        pool.putconn(conn)
+
+
+def backoff(attempts: int) -> float:
+    """Delay before the next attempt: base * 2^(attempts - 1), capped, with +-20% jitter."""
+    delay = min(OUTBOX_MAX_DELAY, OUTBOX_BASE_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def outcome(result: dict, attempts: int) -> tuple:
+    """Map an API result to (status, job_id, error, delay)."""
+    if result.get("status") == "error":
+        # The call itself failed (timeout, outage, exception): retry with backoff
+        error = result.get("message", "Send failed")
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            return "dead", None, error, 0.0
+        return "pending", None, error, backoff(attempts)
+
+    if not result.get("emails") and result.get("failed_emails"):
+        # Every recipient was rejected: permanent, a retry would be rejected again
+        failed = result["failed_emails"]
+        reasons = failed.values() if isinstance(failed, dict) else [item.get("reason") for item in failed]
+        return "dead", None, "Rejected: " + ", ".join(str(reason) for reason in reasons), 0.0
+
+    return "sent", result.get("job_id"), None, 0.0
+
+
+def drain(send, batch_size: int = 20, time_budget: float = 20.0) -> dict:
+    """
+    Claim and send due messages until the queue is empty or time_budget runs out.
+
+    Args:
+        send: Function posting one message and returning the API result
+        batch_size: Rows claimed per transaction
+        time_budget: Seconds after which no further message is sent
+    """
+    stats = {"claimed": 0, "sent": 0, "retry": 0, "dead": 0, "released": 0}
+    deadline = time.monotonic() + time_budget
+    lease = OUTBOX_LEASE + batch_size * SEND_TIMEOUT
+    conn = pool.getconn()
+    try:
+        while time.monotonic() < deadline:
+            with conn.cursor() as cur:
+                cur.execute(CLAIM_SQL, {"lease": lease, "limit": batch_size})
+                claimed = cur.fetchall()
+            conn.commit()
+            if not claimed:
+                break
+            stats["claimed"] += len(claimed)
+
+            results = {"ids": [], "attempts": [], "statuses": [], "job_ids": [], "errors": [], "delays": []}
+            released = {"ids": [], "attempts": []}
+            for outbox_id, message, attempts in claimed:
+                if time.monotonic() >= deadline:
+                    released["ids"].append(outbox_id)
+                    released["attempts"].append(attempts)
+                    continue
+                try:
+                    if isinstance(message, str):
+                        message = json.loads(message)
+                    result = send(message)
+                except Exception as e:
+                    result = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+                status, job_id, error, delay = outcome(result, attempts)
+                stats["retry" if status == "pending" else status] += 1
+                results["ids"].append(outbox_id)
+                results["attempts"].append(attempts)
+                results["statuses"].append(status)
+                results["job_ids"].append(job_id)
+                results["errors"].append(error)
+                results["delays"].append(delay)
+
+            with conn.cursor() as cur:
+                cur.execute(FINISH_SQL, results)
+                if released["ids"]:
+                    cur.execute(RELEASE_SQL, released)
+            conn.commit()
+            stats["released"] += len(released["ids"])
+    finally:
+        pool.putconn(conn)
+    return stats
@@ -0,0 +1,131 @@
+"""
+Local email templates compiled once per warm container.
+
+A template source is split once into literal chunks and placeholder names, so a
+render is a single join instead of one str.replace pass per substitution. Built-in
+templates are compiled at import. Renders of a named template are memoized per
+identical substitution set: the same quest or item notification is built only once.
+Inline bodies from requests are not rendered here; the provider substitutes them.
+
+Only placeholders present in the substitutions are filled; unknown ones are left
+as written. Substituted values are HTML-escaped in bodies; subjects are rendered as
+plain text.
+"""
+
+import html
+import os
+import re
+from functools import lru_cache
+from itertools import chain
+from typing import Optional
+
+RENDER_CACHE_SIZE = int(os.environ.get("TEMPLATE_RENDER_CACHE_SIZE", "1024"))
+
+PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z0-9_.-]+)\s*\}\}")
+
+
+# =============================================================================
+# BUILT-IN TEMPLATES
+# =============================================================================
+
+LAYOUT = """
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px;">
+            {content}
+            <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
+            <p style="color: #999; font-size: 12px;">
+                Это автоматическое письмо. Отвечать на него не нужно.
+            </p>
+        </div>
+        """
+
+TEMPLATES = {
+    "test": {
+        "subject": "Тестовое письмо от Unisender Go",
+        "html": LAYOUT.format(content="""<h1 style="color: #333;">Тестовое письмо</h1>
+            <p>Если вы видите это письмо — настройка Unisender Go прошла успешно!</p>
+            <p style="color: #666; font-size: 14px;">
+                Отправитель: {{sender_email}}<br>
+                Время: {{timestamp}}
+            </p>"""),
+    },
+    "quest-complete": {
+        "subject": "Квест «{{quest_name}}» выполнен!",
+        "html": LAYOUT.format(content="""<h1 style="color: #333;">Квест выполнен</h1>
+            <p>{{username}}, ваш питомец {{pet_name}} закрыл квест «{{quest_name}}».</p>
+            <p>Награда: <b>{{reward}}</b> монет уже на счету.</p>"""),
+    },
+    "item-sold": {
+        "subject": "Ваш предмет «{{item_name}}» продан",
+        "html": LAYOUT.format(content="""<h1 style="color: #333;">Предмет продан</h1>
+            <p>{{username}}, игрок {{buyer}} купил «{{item_name}}».</p>
+            <p>На ваш счёт зачислено <b>{{price}}</b> монет.</p>"""),
+    },
+}
+
+
+# =============================================================================
+# COMPILE & RENDER
+# =============================================================================
+
+def _compile(source: str) -> tuple:
+    """Split source into (literals, names, tokens); tokens keep each placeholder verbatim."""
+    literals, names, tokens = [], [], []
+    position = 0
+    for match in PLACEHOLDER.finditer(source):
+        literals.append(source[position:match.start()])
+        names.append(match.group(1))
+        tokens.append(match.group(0))
+        position = match.end()
+    literals.append(source[position:])
+    return tuple(literals), tuple(names), tuple(tokens)
+
+
+# Built-in templates are compiled once at import
+COMPILED = {
+    name: (_compile(template["subject"]), _compile(template["html"]))
+    for name, template in TEMPLATES.items()
+}
+
+
+def render_compiled(compiled: tuple, substitutions: dict, escape: bool = True) -> str:
+    """Fill a compiled template; unknown placeholders are left as written."""
+    literals, names, tokens = compiled
+    values = []
+    for name, token in zip(names, tokens):
+        if name in substitutions:
+            value = str(substitutions[name])
+            values.append(html.escape(value) if escape else value)
+        else:
+            values.append(token)
+    values.append("")
+    return "".join(chain.from_iterable(zip(literals, values)))
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render_named(name: str, frozen: tuple) -> tuple:
+    subject, body = COMPILED[name]
+    substitutions = dict(frozen)
+    return render_compiled(subject, substitutions, escape=False), render_compiled(body, substitutions)
+
+
+def render_template(name: str, substitutions: Optional[dict] = None) -> tuple:
+    """
+    Render a built-in template to (subject, html).
+
+    Identical substitution sets hit the render cache and reuse the built strings.
+    """
+    if name not in TEMPLATES:
+        raise KeyError(name)
+    frozen = tuple(sorted((substitutions or {}).items()))
+    try:
+        return _render_named(name, frozen)
+    except TypeError:
+        # Unhashable values (lists, dicts) are rendered by their string form
+        return _render_named(name, tuple((key, str(value)) for key, value in frozen))
+
+
+def cache_info() -> dict:
+    return {
+        "compiled": len(COMPILED),
+        "rendered": _render_named.cache_info()._asdict(),
+    }
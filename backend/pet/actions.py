@@ -0,0 +1,139 @@
+'''Действия с питомцем: таблица правил и сборка пакета действий в один запрос
+
+Каждое изменение характеристики — это прибавка с ограничением сверху (LEAST(100, ...))
+для положительных изменений или снизу (GREATEST(0, ...)) для отрицательных. Композиция
+таких функций снова имеет вид clamp(x + a, lo, hi), поэтому любая последовательность
+действий сводится к одному выражению на характеристику и даёт тот же результат, что и
+поштучное применение.
+
+Квесты выбираются по ключу действия из реестра quest_definitions через индекс
+(user_id, action_key): прогресс, закрытие квеста и начисление награды происходят в том
+же запросе, что и само действие. Там же поддерживаются счётчики корзин рейтинга
+(см. leaderboard.py).
+'''
+
+from decay import STATS, decayed, update_pet_sql
+from leaderboard import buckets_cte
+from levels import level_for_xp, xp_to_next
+from notify import notify_sql
+
+MAX_BATCH_ACTIONS = 50
+
+ACTIONS = {
+    'feed': {'stats': {'hunger': 20, 'happiness': 5}, 'xp': 10, 'touch': 'last_fed'},
+    'play': {'stats': {'happiness': 25, 'energy': -15}, 'xp': 15, 'touch': 'last_played'},
+    'heal': {'stats': {'health': 30}, 'xp': 5},
+    'rest': {'stats': {'energy': 40}, 'xp': 5},
+}
+
+STAT_MIN = 0
+STAT_MAX = 100
+
+INF = float('inf')
+
+
+def _clamp(value: float, lo: float, hi: float) -> float:
+    return min(hi, max(lo, value))
+
+
+def compose_step(current: tuple, delta: int) -> tuple:
+    '''Добавляет к композиции (a, lo, hi) ещё одно изменение характеристики'''
+    add, lo, hi = current
+    step_lo, step_hi = (-INF, STAT_MAX) if delta >= 0 else (STAT_MIN, INF)
+    return (
+        add + delta,
+        _clamp(lo + delta, step_lo, step_hi),
+        _clamp(hi + delta, step_lo, step_hi)
+    )
+
+
+def plan_actions(actions: list, multipliers: dict = None) -> dict:
+    '''Сводит упорядоченный список действий к итоговым изменениям
+
+    multipliers — проценты опыта и монет от действующих событий (см. events.py).
+    Процент применяется к каждому действию и каждой награде до суммирования, поэтому
+    пакет даёт столько же, сколько те же действия по одному.
+    '''
+    multipliers = multipliers or {}
+    xp_percent = multipliers.get('xp', 100)
+    stats = {}
+    touch = []
+    counts = {}
+    xp = 0
+    for name in actions:
+        rule = ACTIONS[name]
+        for stat, delta in rule['stats'].items():
+            stats[stat] = compose_step(stats.get(stat, (0, -INF, INF)), delta)
+        xp += rule['xp'] * xp_percent // 100
+        if rule.get('touch') and rule['touch'] not in touch:
+            touch.append(rule['touch'])
+        counts[name] = counts.get(name, 0) + 1
+    return {
+        'stats': stats,
+        'xp': xp,
+        'coin_percent': multipliers.get('coins', 100),
+        'touch': touch,
+        'counts': counts,
+        'returning': tuple(stat for stat in STATS if stat in stats) + ('xp', 'level')
+    }
+
+
+def stat_expression(stat: str, composed: tuple) -> str:
+    add, lo, hi = composed
+    expression = f'{decayed(stat)} + {int(add)}' if add >= 0 else f'{decayed(stat)} - {int(-add)}'
+    if lo != -INF:
+        expression = f'GREATEST({int(lo)}, {expression})'
+    if hi != INF:
+        expression = f'LEAST({int(hi)}, {expression})'
+    return expression
+
+
+def action_statement(plan: dict, user_id) -> tuple:
+    '''Один запрос на пакет: питомец с уровнем, квесты с наградой, корзины рейтинга и версия состояния через CTE'''
+    changes = {stat: stat_expression(stat, composed) for stat, composed in plan['stats'].items()}
+    gained = int(plan['xp'])
+    changes['xp'] = f"p.xp + {gained}"
+    # Уровень не понижается, даже если таблицу порогов ужесточат
+    changes['level'] = f"GREATEST(p.level, {level_for_xp(f'p.xp + {gained}')})"
+    for column in plan['touch']:
+        changes[column] = 'LOCALTIMESTAMP'
+
+    params = {'user_id': user_id}
+    ctes = [f"pet AS ({update_pet_sql(changes, plan['returning'])})"]
+
+    # Ключи действий берутся только из ACTIONS, поэтому подставляются в запрос как литералы
+    branches = ' '.join(f"WHEN '{name}' THEN {int(count)}" for name, count in plan['counts'].items())
+    increment = f"CASE action_key {branches} ELSE 0 END"
+    keys = ', '.join(f"'{name}'" for name in plan['counts'])
+    ctes.append(
+        "quests AS (UPDATE user_quests SET "
+        f"progress = LEAST(goal, progress + {increment}), "
+        f"completed = progress + {increment} >= goal, "
+        f"completed_at = CASE WHEN progress + {increment} >= goal THEN LOCALTIMESTAMP END "
+        f"WHERE user_id = %(user_id)s AND action_key IN ({keys}) AND completed = FALSE "
+        "RETURNING quest_name, reward, completed)"
+    )
+    ctes.append(
+        f"reward AS (SELECT COALESCE(SUM(reward * {int(plan['coin_percent'])} / 100), 0) AS coins "
+        "FROM quests WHERE completed)"
+    )
+    ctes.append(
+        "account AS (UPDATE users SET state_version = state_version + 1, "
+        "coins = coins + (SELECT coins FROM reward), "
+        f"xp = xp + {gained}, level = GREATEST(level, {level_for_xp(f'users.xp + {gained}')}) "
+        "WHERE id = %(user_id)s)"
+    )
+    # Корзины рейтинга меняются только при переходе через границу, иначе запись не нужна
+    ctes.append(buckets_cte(plan['xp']))
+    # Клиенты получают новое состояние и закрытые квесты без повторного GET
+    payload = (
+        "json_build_object('t', 'pet', 'u', %(user_id)s::INTEGER, 'pet', row_to_json(pet), "
+        f"'xp_to_next', {xp_to_next('pet.level', 'pet.xp')}, "
+        "'reward', (SELECT coins FROM reward), "
+        "'quests', (SELECT json_agg(quest_name) FROM quests WHERE completed))"
+    )
+    sql = (
+        f"WITH {', '.join(ctes)} SELECT {', '.join(plan['returning'])}, "
+        f"{xp_to_next('pet.level', 'pet.xp')}, {notify_sql(payload)}, (SELECT coins FROM reward) FROM pet"
+    )
+    return sql, params
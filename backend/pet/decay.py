@@ -0,0 +1,62 @@
+'''Ленивое затухание характеристик питомца
+
+Сохранённые в pets значения актуальны на момент stats_updated_at. Текущие значения
+для чтения считает представление pets_decayed по скоростям из pet_decay_rates, поэтому
+фоновый обход всех строк не нужен, а любая запись материализует затухание вместе со
+своим изменением.
+
+Запись считает затухание не по представлению, а выражениями от колонок самой
+обновляемой строки p. При READ COMMITTED параллельный UPDATE того же питомца ждёт
+блокировку и пересчитывает SET по свежей версии строки; значения из соединённого
+представления остались бы от старой версии и затёрли бы чужое действие.
+'''
+
+STATS = ('hunger', 'happiness', 'health', 'energy')
+
+DEFAULT_TICK_SECONDS = 600
+
+
+def _rate(column: str, default: int) -> str:
+    return f"COALESCE((SELECT r.{column} FROM pet_decay_rates r WHERE r.pet_type = p.pet_type), {default})"
+
+
+TICK_SECONDS_SQL = _rate('tick_seconds', DEFAULT_TICK_SECONDS)
+
+# Целые тики с stats_updated_at обновляемой строки p
+TICKS_SQL = (
+    f"GREATEST(0, FLOOR(EXTRACT(EPOCH FROM (LOCALTIMESTAMP - p.stats_updated_at)) / {TICK_SECONDS_SQL}))::INTEGER"
+)
+
+# stats_updated_at сдвигается ровно на учтённые тики, остаток не теряется
+STATS_UPDATED_AT_SQL = f"p.stats_updated_at + {TICKS_SQL} * {TICK_SECONDS_SQL} * INTERVAL '1 second'"
+
+
+def decayed(stat: str) -> str:
+    '''Характеристика строки p с учётом затухания — то же, что колонка pets_decayed'''
+    return f"LEAST(100, GREATEST(0, p.{stat} - {TICKS_SQL} * {_rate(f'{stat}_per_tick', 0)}))"
+
+
+MATERIALIZE_CHUNK_SQL = f"""
+    UPDATE pets p SET
+        {', '.join(f'{stat} = {decayed(stat)}' for stat in STATS)},
+        stats_updated_at = {STATS_UPDATED_AT_SQL}
+    WHERE p.id >= %s AND p.id < %s AND {TICKS_SQL} > 0
+"""
+
+
+def update_pet_sql(changes: dict, returning: tuple) -> str:
+    '''UPDATE питомца поверх затухших значений
+
+    changes — выражения для колонок, построенные от decayed(stat) и колонок строки p.
+    Не упомянутые характеристики просто материализуются. Единственный параметр
+    запроса — именованный %(user_id)s.
+    '''
+    changes = dict(changes)
+    assignments = [f"{stat} = {changes.pop(stat, decayed(stat))}" for stat in STATS]
+    assignments += [f"{column} = {expression}" for column, expression in changes.items()]
+    assignments.append(f"stats_updated_at = {STATS_UPDATED_AT_SQL}")
+    return (
+        f"UPDATE pets p SET {', '.join(assignments)} "
+        "WHERE p.user_id = %(user_id)s "
+        f"RETURNING {', '.join(f'p.{column}' for column in returning)}"
+    )
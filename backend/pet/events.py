@@ -0,0 +1,59 @@
+'''Активные события и их множители наград, закешированные в тёплом контейнере
+
+События с reward_type 'xp_multiplier' или 'coin_multiplier' умножают опыт за действия
+и монеты за закрытые квесты на reward_amount процентов (150 — в полтора раза).
+Одновременные события перемножаются.
+
+Все включённые и не закончившиеся события читаются одним запросом не чаще раза в
+EVENTS_TTL секунд. Начало и конец каждого события проверяются при каждом вызове по
+закешированным границам и часам базы на момент загрузки, поэтому событие включается
+и выключается ровно в свою секунду без лишних запросов.
+'''
+
+import os
+import time
+
+EVENTS_TTL = float(os.environ.get('EVENTS_TTL', '60'))
+
+MULTIPLIER_TYPES = {'xp_multiplier': 'xp', 'coin_multiplier': 'coins'}
+
+EVENTS_SQL = """
+    SELECT event_name, reward_type, reward_amount,
+           EXTRACT(EPOCH FROM start_time), EXTRACT(EPOCH FROM end_time),
+           EXTRACT(EPOCH FROM LOCALTIMESTAMP)
+    FROM events
+    WHERE active = TRUE
+      AND reward_type IN ('xp_multiplier', 'coin_multiplier')
+      AND reward_amount > 0
+      AND (end_time IS NULL OR end_time > LOCALTIMESTAMP)
+"""
+
+_cache = {'events': (), 'db_now': 0.0, 'loaded_at': float('-inf')}
+
+
+def _load(cur) -> None:
+    cur.execute(EVENTS_SQL)
+    rows = cur.fetchall()
+    _cache['events'] = tuple(
+        (name, MULTIPLIER_TYPES[reward_type], amount, float(start or 0), float(end) if end is not None else float('inf'))
+        for name, reward_type, amount, start, end, _ in rows
+    )
+    _cache['db_now'] = float(rows[0][5]) if rows else 0.0
+    _cache['loaded_at'] = time.monotonic()
+
+
+def active_multipliers(cur) -> dict:
+    '''Множители в процентах {'xp': ..., 'coins': ...} и имена действующих событий'''
+    now = time.monotonic()
+    if now - _cache['loaded_at'] > EVENTS_TTL:
+        _load(cur)
+        now = _cache['loaded_at']
+    db_now = _cache['db_now'] + (now - _cache['loaded_at'])
+
+    multipliers = {'xp': 100, 'coins': 100, 'events': []}
+    for name, kind, amount, start, end in _cache['events']:
+        if start <= db_now < end:
+            multipliers[kind] = multipliers[kind] * amount // 100
+            if name not in multipliers['events']:
+                multipliers['events'].append(name)
+    return multipliers
@@ -0,0 +1,61 @@
+'''Заголовок Idempotency-Key для POST: повтор получает сохранённый ответ
+
+claim вставляет ключ в той же транзакции, что и действие. Параллельный дубль ждёт на
+первичном ключе, пока первый запрос не завершится: после коммита он получает
+сохранённый ответ, после отката выполняется сам. Ответ записывает remember перед
+коммитом. Ключ живёт IDEMPOTENCY_TTL секунд и привязан к пользователю, функции и
+телу запроса: тот же ключ с другим телом отклоняется.
+'''
+
+import hashlib
+import os
+
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', str(24 * 3600)))
+MAX_KEY_LENGTH = 100
+
+CLAIM_SQL = """
+    INSERT INTO idempotency_keys (user_id, scope, idem_key, request_hash, expires_at)
+    VALUES (%(user_id)s, %(scope)s, %(key)s, %(hash)s, LOCALTIMESTAMP + make_interval(secs => %(ttl)s))
+    ON CONFLICT (user_id, scope, idem_key) DO UPDATE SET
+        request_hash = EXCLUDED.request_hash,
+        status_code = NULL,
+        body = NULL,
+        expires_at = EXCLUDED.expires_at
+    WHERE idempotency_keys.expires_at < LOCALTIMESTAMP
+    RETURNING 1
+"""
+
+STORED_SQL = """
+    SELECT request_hash, status_code, body FROM idempotency_keys
+    WHERE user_id = %(user_id)s AND scope = %(scope)s AND idem_key = %(key)s
+"""
+
+REMEMBER_SQL = """
+    UPDATE idempotency_keys SET status_code = %(status)s, body = %(body)s
+    WHERE user_id = %(user_id)s AND scope = %(scope)s AND idem_key = %(key)s
+"""
+
+
+def request_hash(raw_body) -> str:
+    return hashlib.md5((raw_body or '').encode()).hexdigest()
+
+
+def claim(cur, scope: str, user_id, key: str, raw_body) -> tuple:
+    '''Занимает ключ: (None, None) — выполнять запрос, ((статус, тело), None) — отдать
+    сохранённый ответ, (None, (статус, ошибка)) — ключ использовать нельзя
+    '''
+    if len(key) > MAX_KEY_LENGTH:
+        return None, (400, 'Слишком длинный Idempotency-Key')
+    params = {'user_id': user_id, 'scope': scope, 'key': key, 'hash': request_hash(raw_body), 'ttl': IDEMPOTENCY_TTL}
+    cur.execute(CLAIM_SQL, params)
+    if cur.fetchone():
+        return None, None
+    cur.execute(STORED_SQL, params)
+    stored_hash, status, body = cur.fetchone()
+    if stored_hash != params['hash']:
+        return None, (422, 'Idempotency-Key уже использован с другим запросом')
+    return (status, body), None
+
+
+def remember(cur, scope: str, user_id, key: str, status: int, body: str) -> None:
+    cur.execute(REMEMBER_SQL, {'user_id': user_id, 'scope': scope, 'key': key, 'status': status, 'body': body})
@@ -1,8 +1,30 @@
 import json
-import os
-import psycopg2
-from datetime import datetime
+from collections import Counter
 
+from actions import ACTIONS, MAX_BATCH_ACTIONS, action_statement, plan_actions
+from db import pool
+from events import active_multipliers
+from idempotency import claim, remember
+from leaderboard import DEFAULT_TOP, MAX_TOP, fetch_leaderboard
+from ratelimit import take_all
+from snapshot import etag_matches, fetch_snapshot, fetch_version, make_etag
+from timing import dumps, instrumented
+from tokens import authenticate
+
+# (запас, пополнение в секунду) на пользователя и действие
+RATE_LIMITS = {name: (60, 1.0) for name in ACTIONS}
+
+
+def get_header(event: dict, name: str) -> str:
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+@instrumented('pet', extra=pool.stats)
 def handler(event: dict, context) -> dict:
     '''API для управления питомцами и их характеристиками'''
     
@@ -14,84 +36,86 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, Authorization'
+                'Access-Control-Allow-Headers': 'Content-Type, Authorization, If-None-Match, Idempotency-Key',
+                'Access-Control-Expose-Headers': 'ETag'
             },
             'body': ''
         }
     
+    conn = None
+    cur = None
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = pool.getconn()
         cur = conn.cursor()
         
         if method == 'GET':
-            params = event.get('queryStringParameters', {})
+            params = event.get('queryStringParameters') or {}
             user_id = params.get('user_id')
             
-            if not user_id:
+            user_id, auth_error = authenticate(get_header(event, 'Authorization'), user_id, cur)
+            
+            if auth_error:
                 return {
-                    'statusCode': 400,
+                    'statusCode': auth_error[0],
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'user_id обязателен'})
+                    'body': dumps({'error': auth_error[1]})
                 }
             
-            cur.execute(
-                "SELECT id, name, pet_type, level, xp, hunger, happiness, health, energy FROM pets WHERE user_id = %s",
-                (user_id,)
-            )
-            pet = cur.fetchone()
-            
-            if not pet:
+            if params.get('action') == 'leaderboard':
+                try:
+                    limit = min(MAX_TOP, max(1, int(params.get('limit') or DEFAULT_TOP)))
+                except ValueError:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': dumps({'error': 'Некорректный limit'})
+                    }
+                
                 return {
-                    'statusCode': 404,
+                    'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Питомец не найден'})
+                    'body': dumps(fetch_leaderboard(cur, limit, user_id))
                 }
             
-            cur.execute("SELECT level, coins, xp FROM users WHERE id = %s", (user_id,))
-            user = cur.fetchone()
+            if not user_id:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'error': 'user_id обязателен'})
+                }
             
-            cur.execute(
-                "SELECT item_name, item_type, effect, quantity FROM inventory WHERE user_id = %s",
-                (user_id,)
-            )
-            inventory = cur.fetchall()
+            if_none_match = get_header(event, 'If-None-Match')
+            if if_none_match:
+                version = fetch_version(cur, user_id)
+                if version is not None and etag_matches(if_none_match, make_etag(*version)):
+                    return {
+                        'statusCode': 304,
+                        'headers': {
+                            'ETag': make_etag(*version),
+                            'Access-Control-Allow-Origin': '*',
+                            'Access-Control-Expose-Headers': 'ETag'
+                        },
+                        'body': ''
+                    }
             
-            cur.execute(
-                "SELECT achievement_name, completed FROM user_achievements WHERE user_id = %s",
-                (user_id,)
-            )
-            achievements = cur.fetchall()
+            snapshot = fetch_snapshot(cur, user_id)
             
-            cur.execute(
-                "SELECT quest_name, progress, goal, reward, completed FROM user_quests WHERE user_id = %s",
-                (user_id,)
-            )
-            quests = cur.fetchall()
+            if not snapshot:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'error': 'Питомец не найден'})
+                }
             
             return {
                 'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
-                    'pet': {
-                        'id': pet[0],
-                        'name': pet[1],
-                        'type': pet[2],
-                        'level': pet[3],
-                        'xp': pet[4],
-                        'hunger': pet[5],
-                        'happiness': pet[6],
-                        'health': pet[7],
-                        'energy': pet[8]
-                    },
-                    'user': {
-                        'level': user[0],
-                        'coins': user[1],
-                        'xp': user[2]
-                    },
-                    'inventory': [{'name': i[0], 'type': i[1], 'effect': i[2], 'quantity': i[3]} for i in inventory],
-                    'achievements': [{'name': a[0], 'completed': a[1]} for a in achievements],
-                    'quests': [{'name': q[0], 'progress': q[1], 'goal': q[2], 'reward': q[3], 'completed': q[4]} for q in quests]
-                })
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'ETag': make_etag(snapshot[1], snapshot[2]),
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'ETag'
+                },
+                'body': snapshot[0]
             }
         
         elif method == 'POST':
@@ -99,95 +123,111 @@ def handler(event: dict, context) -> dict:
             action = body.get('action')
             user_id = body.get('user_id')
             
+            user_id, auth_error = authenticate(get_header(event, 'Authorization'), user_id, cur)
+            
+            if auth_error:
+                return {
+                    'statusCode': auth_error[0],
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'error': auth_error[1]})
+                }
+            
             if not user_id:
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'user_id обязателен'})
+                    'body': dumps({'error': 'user_id обязателен'})
                 }
             
-            if action == 'feed':
-                cur.execute(
-                    "UPDATE pets SET hunger = LEAST(100, hunger + 20), happiness = LEAST(100, happiness + 5), xp = xp + 10, last_fed = %s WHERE user_id = %s RETURNING hunger, happiness, xp",
-                    (datetime.now(), user_id)
-                )
-                result = cur.fetchone()
-                
-                cur.execute(
-                    "UPDATE user_quests SET progress = LEAST(progress + 1, goal) WHERE user_id = %s AND quest_name = %s AND completed = FALSE",
-                    (user_id, 'Покорми питомца 3 раза')
-                )
-                
-                conn.commit()
-                
+            actions = body.get('actions') or ([action] if action else [])
+            
+            if not isinstance(actions, list) or len(actions) > MAX_BATCH_ACTIONS or any(not isinstance(a, str) or a not in ACTIONS for a in actions):
                 return {
-                    'statusCode': 200,
+                    'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'hunger': result[0], 'happiness': result[1], 'xp': result[2]})
+                    'body': dumps({'error': 'Неизвестное действие'})
                 }
             
-            elif action == 'play':
-                cur.execute(
-                    "UPDATE pets SET happiness = LEAST(100, happiness + 25), energy = GREATEST(0, energy - 15), xp = xp + 15, last_played = %s WHERE user_id = %s RETURNING happiness, energy, xp",
-                    (datetime.now(), user_id)
-                )
-                result = cur.fetchone()
+            if actions:
+                # Повтор с тем же ключом отдаёт сохранённый ответ и не тратит лимит
+                idempotency_key = get_header(event, 'Idempotency-Key')
+                if idempotency_key:
+                    replay, idempotency_error = claim(cur, 'pet', user_id, idempotency_key, event.get('body'))
+                    if idempotency_error:
+                        return {
+                            'statusCode': idempotency_error[0],
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': dumps({'error': idempotency_error[1]})
+                        }
+                    if replay:
+                        return {
+                            'statusCode': replay[0],
+                            'headers': {
+                                'Content-Type': 'application/json',
+                                'Idempotent-Replayed': 'true',
+                                'Access-Control-Allow-Origin': '*'
+                            },
+                            'body': replay[1]
+                        }
                 
-                cur.execute(
-                    "UPDATE user_quests SET progress = LEAST(progress + 1, goal) WHERE user_id = %s AND quest_name = %s AND completed = FALSE",
-                    (user_id, 'Поиграй 5 раз')
-                )
+                retry_after = take_all(user_id, {name: (RATE_LIMITS[name], count) for name, count in Counter(actions).items()})
                 
-                conn.commit()
+                if retry_after:
+                    conn.rollback()
+                    return {
+                        'statusCode': 429,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Retry-After': str(int(retry_after) + 1),
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': dumps({'error': 'Слишком много действий, попробуйте позже'})
+                    }
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'happiness': result[0], 'energy': result[1], 'xp': result[2]})
-                }
-            
-            elif action == 'heal':
-                cur.execute(
-                    "UPDATE pets SET health = LEAST(100, health + 30), xp = xp + 5 WHERE user_id = %s RETURNING health, xp",
-                    (user_id,)
-                )
+                multipliers = active_multipliers(cur)
+                plan = plan_actions(actions, multipliers)
+                cur.execute(*action_statement(plan, user_id))
                 result = cur.fetchone()
-                conn.commit()
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'health': result[0], 'xp': result[1]})
-                }
-            
-            elif action == 'rest':
-                cur.execute(
-                    "UPDATE pets SET energy = LEAST(100, energy + 40), xp = xp + 5 WHERE user_id = %s RETURNING energy, xp",
-                    (user_id,)
-                )
-                result = cur.fetchone()
+                if not result:
+                    conn.rollback()
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': dumps({'error': 'Питомец не найден'})
+                    }
+                
+                response = dict(zip(plan['returning'] + ('xp_to_next',), result))
+                if result[-1]:
+                    response['quest_reward'] = result[-1]
+                if multipliers['events']:
+                    response['events'] = multipliers['events']
+                response_body = dumps(response)
+                
+                if idempotency_key:
+                    remember(cur, 'pet', user_id, idempotency_key, 200, response_body)
                 conn.commit()
                 
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'energy': result[0], 'xp': result[1]})
+                    'body': response_body
                 }
         
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Метод не поддерживается'})
+            'body': dumps({'error': 'Метод не поддерживается'})
         }
         
     except Exception as e:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'})
+            'body': dumps({'error': f'Ошибка сервера: {str(e)}'})
         }
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            pool.putconn(conn)
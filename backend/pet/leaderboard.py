@@ -0,0 +1,96 @@
+'''Рейтинг питомцев по опыту с инкрементально поддерживаемыми корзинами
+
+leaderboard_buckets хранит число питомцев с опытом в [bucket * BUCKET_WIDTH,
+(bucket + 1) * BUCKET_WIDTH), учитываются только питомцы с опытом больше нуля.
+Место = 1 + сумма корзин выше своей + питомцы своей корзины с большим опытом, поэтому
+запрос читает несколько сотен строк корзин и короткий диапазон idx_pets_xp вместо
+сортировки всех игроков.
+'''
+
+# Должно совпадать с шириной корзины в миграции V0008
+BUCKET_WIDTH = 100
+
+DEFAULT_TOP = 10
+MAX_TOP = 100
+
+
+def buckets_cte(xp_gain: int) -> str:
+    '''CTE для запроса действия: переносит питомца из корзины старого опыта в корзину нового
+
+    Старый опыт считается как p.xp - xp_gain по уже обновлённой строке, а не по
+    снимку запроса, поэтому параллельные действия того же игрока не сбивают счётчики.
+    '''
+    return f"""board AS (
+    INSERT INTO leaderboard_buckets (bucket, players)
+    SELECT bucket, SUM(delta) FROM (
+        SELECT xp / {BUCKET_WIDTH} AS bucket, 1 AS delta FROM pet WHERE xp > 0
+        UNION ALL
+        SELECT (xp - {int(xp_gain)}) / {BUCKET_WIDTH}, -1 FROM pet WHERE xp - {int(xp_gain)} > 0
+    ) moves
+    GROUP BY bucket
+    HAVING SUM(delta) != 0
+    ON CONFLICT (bucket) DO UPDATE SET players = leaderboard_buckets.players + EXCLUDED.players
+)"""
+
+
+TOP_SQL = """
+    SELECT RANK() OVER (ORDER BY t.xp DESC), t.name, u.username, t.level, t.xp
+    FROM (
+        SELECT user_id, name, level, xp FROM pets
+        WHERE xp > 0
+        ORDER BY xp DESC, id
+        LIMIT %s
+    ) t
+    JOIN users u ON u.id = t.user_id
+    ORDER BY t.xp DESC
+"""
+
+RANK_SQL = f"""
+    SELECT me.xp,
+           1 + COALESCE((
+               SELECT SUM(players) FROM leaderboard_buckets WHERE bucket > me.xp / {BUCKET_WIDTH}
+           ), 0) + (
+               SELECT COUNT(*) FROM pets o
+               WHERE o.xp > me.xp AND o.xp < (me.xp / {BUCKET_WIDTH} + 1) * {BUCKET_WIDTH}
+           )
+    FROM pets me
+    WHERE me.user_id = %s
+"""
+
+RECONCILE_LOCK_SQL = "SELECT bucket FROM leaderboard_buckets WHERE bucket >= %(low)s AND bucket < %(high)s FOR UPDATE"
+
+RECONCILE_SQL = f"""
+    WITH actual AS (
+        SELECT xp / {BUCKET_WIDTH} AS bucket, COUNT(*) AS players
+        FROM pets
+        WHERE xp > 0 AND xp >= %(low)s * {BUCKET_WIDTH} AND xp < %(high)s * {BUCKET_WIDTH}
+        GROUP BY xp / {BUCKET_WIDTH}
+    ), fixed AS (
+        INSERT INTO leaderboard_buckets (bucket, players)
+        SELECT bucket, players FROM actual
+        ON CONFLICT (bucket) DO UPDATE SET players = EXCLUDED.players
+        WHERE leaderboard_buckets.players != EXCLUDED.players
+        RETURNING bucket
+    ), removed AS (
+        DELETE FROM leaderboard_buckets b
+        WHERE b.bucket >= %(low)s AND b.bucket < %(high)s
+          AND NOT EXISTS (SELECT 1 FROM actual a WHERE a.bucket = b.bucket)
+        RETURNING bucket
+    )
+    SELECT (SELECT COUNT(*) FROM fixed), (SELECT COUNT(*) FROM removed)
+"""
+
+
+def fetch_leaderboard(cur, limit: int, user_id=None) -> dict:
+    cur.execute(TOP_SQL, (limit,))
+    top = [
+        {'rank': r[0], 'name': r[1], 'username': r[2], 'level': r[3], 'xp': r[4]}
+        for r in cur.fetchall()
+    ]
+    me = None
+    if user_id:
+        cur.execute(RANK_SQL, (user_id,))
+        row = cur.fetchone()
+        if row:
+            me = {'xp': row[0], 'rank': row[1] if row[0] > 0 else None}
+    return {'top': top, 'me': me}
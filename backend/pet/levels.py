@@ -0,0 +1,51 @@
+'''Уровни по таблице порогов level_thresholds
+
+Уровень и остаток опыта до следующего считаются подзапросами к маленькой таблице
+порогов прямо в запросе действия или снимка, поэтому отдельного обращения к базе нет.
+На последнем уровне xp_to_next равен NULL. Колонки опыта и уровня передаются
+с именем таблицы: внутри подзапроса у level_thresholds своя колонка level.
+'''
+
+
+def level_for_xp(xp_sql: str) -> str:
+    return (
+        f"(SELECT lt.level FROM level_thresholds lt WHERE lt.xp_required <= {xp_sql} "
+        "ORDER BY lt.xp_required DESC LIMIT 1)"
+    )
+
+
+def xp_to_next(level_sql: str, xp_sql: str) -> str:
+    return f"((SELECT lt.xp_required FROM level_thresholds lt WHERE lt.level = {level_sql} + 1) - {xp_sql})"
+
+
+def _recompute_chunk_sql(table: str) -> str:
+    # У питомца версия состояния лежит у владельца, у игрока — в той же строке
+    if table == 'pets':
+        version, owner = '', 't.user_id'
+        bump = (
+            ", bumped AS (UPDATE users u SET state_version = u.state_version + 1 "
+            "WHERE u.id IN (SELECT owner FROM changed))"
+        )
+    else:
+        version, owner, bump = ', state_version = t.state_version + 1', 't.id', ''
+    return f"""
+    WITH changed AS (
+        UPDATE {table} t SET level = GREATEST(t.level, l.level){version}
+        FROM (
+            SELECT s.id, COALESCE({level_for_xp('GREATEST(s.xp, 0)')}, 1) AS level
+            FROM {table} s
+            WHERE s.id >= %s AND s.id < %s
+        ) l
+        WHERE t.id = l.id AND COALESCE(t.level, 0) < l.level
+        RETURNING {owner} AS owner
+    ){bump}
+    SELECT COUNT(*) FROM changed
+    """
+
+
+# Пересчёт уровней существующих строк порциями по id (scripts/recompute_levels.py).
+# Позиционные параметры — границы диапазона id, результат — число обновлённых строк.
+# Как и в действиях, уровень только растёт: ужесточение порогов не понижает уже
+# набранные уровни. Затронутым игрокам увеличивается state_version, чтобы ETag снимка
+# сменился.
+RECOMPUTE_CHUNK_SQL = {table: _recompute_chunk_sql(table) for table in ('pets', 'users')}
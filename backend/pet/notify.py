@@ -0,0 +1,14 @@
+'''Уведомления об изменениях состояния через Postgres NOTIFY
+
+Запросы записи вызывают pg_notify в том же выражении, поэтому отдельного обращения к
+базе нет, а уведомление уходит только после коммита. Полезная нагрузка — компактный
+JSON с полями t (тип: pet, sold) и u (кому адресовано); его раздаёт клиентам
+scripts/serve.py по SSE из одного соединения LISTEN на процесс.
+'''
+
+CHANNEL = 'game_events'
+
+
+def notify_sql(payload_sql: str) -> str:
+    '''Выражение для списка SELECT: отправляет JSON payload_sql в CHANNEL'''
+    return f"pg_notify('{CHANNEL}', ({payload_sql})::text)"
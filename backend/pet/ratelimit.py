@@ -0,0 +1,50 @@
+'''Ограничение частоты записей: корзина токенов на пару (пользователь, действие)
+
+Проверка идёт в памяти тёплого контейнера до запроса самого действия; повтор по
+Idempotency-Key получает сохранённый ответ раньше и токенов не тратит. Корзина вмещает
+burst токенов и пополняется со скоростью rate токенов в секунду; каждое действие
+забирает один токен. Число отслеживаемых корзин ограничено RATE_LIMIT_MAX_KEYS,
+давно не тронутые вытесняются первыми. Ограничение действует на контейнер, поэтому
+при нескольких экземплярах общий предел пропорционально выше.
+'''
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '10000'))
+RATE_LIMIT_SCALE = float(os.environ.get('RATE_LIMIT_SCALE', '1'))
+
+_buckets = OrderedDict()
+_lock = threading.Lock()
+
+
+def take(user_id, action: str, limits: tuple, cost: int = 1) -> float:
+    '''Списывает cost токенов; возвращает 0 или сколько секунд ждать до следующей попытки'''
+    return take_all(user_id, {action: (limits, cost)})
+
+
+def take_all(user_id, costs: dict) -> float:
+    '''Списывает токены сразу из нескольких корзин: {действие: (limits, cost)}
+
+    Либо хватает во всех корзинах и списывается из всех, либо не списывается ничего и
+    возвращается наибольшее ожидание, чтобы отклонённый пакет не тратил квоту.
+    '''
+    now = time.monotonic()
+    with _lock:
+        refilled = {}
+        wait = 0.0
+        for action, (limits, cost) in costs.items():
+            burst, rate = limits[0] * RATE_LIMIT_SCALE, limits[1] * RATE_LIMIT_SCALE
+            key = (str(user_id), action)
+            tokens, updated = _buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < cost:
+                wait = max(wait, (cost - tokens) / rate)
+            refilled[key] = (tokens, cost)
+        for key, (tokens, cost) in refilled.items():
+            _buckets[key] = (tokens if wait else tokens - cost, now)
+        while len(_buckets) > RATE_LIMIT_MAX_KEYS:
+            _buckets.popitem(last=False)
+    return wait
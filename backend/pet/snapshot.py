@@ -0,0 +1,99 @@
+'''Снимок состояния игрока одним запросом: питомец, пользователь, инвентарь, достижения, квесты
+
+Каждое изменение состояния увеличивает users.state_version, из которой строится ETag:
+повторный опрос с If-None-Match стоит одного индексного чтения вместо сборки снимка.
+Характеристики питомца берутся из pets_decayed, поэтому в ETag входит и момент, на
+который посчитано затухание.
+'''
+
+from levels import xp_to_next
+
+# JSON собирается на стороне Postgres и возвращается текстом, поэтому
+# обработчик отдаёт его клиенту без разбора и повторной сериализации.
+SNAPSHOT_SQL = """
+    SELECT json_build_object(
+        'pet', json_build_object(
+            'id', p.id,
+            'name', p.name,
+            'type', p.pet_type,
+            'level', p.level,
+            'xp', p.xp,
+            'xp_to_next', XP_TO_NEXT_PET,
+            'hunger', p.hunger,
+            'happiness', p.happiness,
+            'health', p.health,
+            'energy', p.energy
+        ),
+        'user', json_build_object(
+            'level', u.level,
+            'coins', u.coins,
+            'xp', u.xp,
+            'xp_to_next', XP_TO_NEXT_USER
+        ),
+        'inventory', COALESCE((
+            SELECT json_agg(json_build_object(
+                'name', i.item_name,
+                'type', i.item_type,
+                'effect', i.effect,
+                'quantity', i.quantity
+            ) ORDER BY i.id)
+            FROM inventory i
+            WHERE i.user_id = p.user_id AND i.quantity > 0
+        ), '[]'::json),
+        'achievements', COALESCE((
+            SELECT json_agg(json_build_object(
+                'name', a.achievement_name,
+                'completed', a.completed
+            ) ORDER BY a.id)
+            FROM user_achievements a
+            WHERE a.user_id = p.user_id
+        ), '[]'::json),
+        'quests', COALESCE((
+            SELECT json_agg(json_build_object(
+                'name', q.quest_name,
+                'progress', q.progress,
+                'goal', q.goal,
+                'reward', q.reward,
+                'completed', q.completed
+            ) ORDER BY q.id)
+            FROM user_quests q
+            WHERE q.user_id = p.user_id
+        ), '[]'::json)
+    )::text, u.state_version, EXTRACT(EPOCH FROM p.stats_updated_at)::BIGINT
+    FROM pets_decayed p
+    JOIN users u ON u.id = p.user_id
+    WHERE p.user_id = %s
+""".replace('XP_TO_NEXT_PET', xp_to_next('p.level', 'p.xp')).replace('XP_TO_NEXT_USER', xp_to_next('u.level', 'u.xp'))
+
+
+VERSION_SQL = """
+    SELECT u.state_version, EXTRACT(EPOCH FROM p.stats_updated_at)::BIGINT
+    FROM users u
+    JOIN pets_decayed p ON p.user_id = u.id
+    WHERE u.id = %s
+"""
+
+
+def fetch_snapshot(cur, user_id) -> tuple:
+    '''Возвращает (JSON-тело снимка, версия, момент затухания) или None, если питомца нет'''
+    cur.execute(SNAPSHOT_SQL, (user_id,))
+    return cur.fetchone()
+
+
+def fetch_version(cur, user_id) -> tuple:
+    cur.execute(VERSION_SQL, (user_id,))
+    return cur.fetchone()
+
+
+def make_etag(version, decayed_at) -> str:
+    return f'"v{version}.{decayed_at}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate in (etag, '*'):
+            return True
+    return False
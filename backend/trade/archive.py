@@ -0,0 +1,91 @@
+'''Снятие предложений по сроку и перенос закрытых в архив
+
+Горячая таблица trade_offers держит только активные и недавно закрытые предложения:
+её читают лента и покупка. Оба запроса ниже работают порциями по частичным индексам
+(активные по expires_at, закрытые по completed_at) и пропускают строки, захваченные
+параллельной покупкой (SKIP LOCKED), поэтому их можно гонять рядом с живой нагрузкой.
+Запускаются из scripts/archive_offers.py.
+'''
+
+from pricing import EXPIRY_STATS_CTE, refresh_floor
+
+# Истёкшие предложения закрываются со статусом expired, предмет возвращается в стопку
+# инвентаря продавца, сводка цен теряет предложение. Третий столбец — затронутые
+# предметы для пересчёта минимальной цены.
+EXPIRE_CHUNK_SQL = """
+    WITH expired AS (
+        UPDATE trade_offers
+        SET status = 'expired', completed_at = LOCALTIMESTAMP
+        WHERE id IN (
+            SELECT id FROM trade_offers
+            WHERE status = 'active' AND expires_at <= LOCALTIMESTAMP
+            ORDER BY expires_at
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, seller_id, item_name, item_type, effect, price
+    ), returned AS (
+        INSERT INTO inventory (user_id, item_name, item_type, effect, quantity)
+        SELECT seller_id, item_name, MIN(item_type), MIN(effect), COUNT(*)
+        FROM expired
+        GROUP BY seller_id, item_name
+        ON CONFLICT (user_id, item_name) DO UPDATE SET quantity = inventory.quantity + EXCLUDED.quantity
+    ), accounts AS (
+        UPDATE users SET state_version = state_version + 1
+        WHERE id IN (SELECT seller_id FROM expired)
+    ), PRICE_STATS
+    SELECT COUNT(*), COUNT(DISTINCT seller_id), ARRAY_AGG(DISTINCT item_name) FROM expired
+""".replace('PRICE_STATS', EXPIRY_STATS_CTE)
+
+# Закрытые старше keep секунд переезжают в trade_offers_history одним запросом. Из
+# горячей таблицы удаляются только строки, записанные в архив; если id уже есть в
+# архиве (повторный перенос восстановленной строки), архивная копия заменяется
+# актуальной, а не теряется.
+ARCHIVE_CHUNK_SQL = """
+    WITH picked AS (
+        SELECT id, seller_id, buyer_id, item_name, item_type, effect, price, status,
+               created_at, completed_at, expires_at
+        FROM trade_offers
+        WHERE status != 'active' AND completed_at < LOCALTIMESTAMP - make_interval(secs => %(keep)s)
+        ORDER BY completed_at, id
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ), archived AS (
+        INSERT INTO trade_offers_history AS h
+            (id, seller_id, buyer_id, item_name, item_type, effect, price, status,
+             created_at, completed_at, expires_at, archived_at)
+        SELECT *, LOCALTIMESTAMP FROM picked
+        ON CONFLICT (id) DO UPDATE SET
+            seller_id = EXCLUDED.seller_id,
+            buyer_id = EXCLUDED.buyer_id,
+            item_name = EXCLUDED.item_name,
+            item_type = EXCLUDED.item_type,
+            effect = EXCLUDED.effect,
+            price = EXCLUDED.price,
+            status = EXCLUDED.status,
+            created_at = EXCLUDED.created_at,
+            completed_at = EXCLUDED.completed_at,
+            expires_at = EXCLUDED.expires_at,
+            archived_at = EXCLUDED.archived_at
+        RETURNING h.id, xmax != 0 AS replaced
+    ), moved AS (
+        DELETE FROM trade_offers WHERE id IN (SELECT id FROM archived)
+        RETURNING id
+    )
+    SELECT (SELECT COUNT(*) FROM moved), (SELECT COUNT(*) FROM archived WHERE replaced)
+"""
+
+
+def expire_chunk(cur, limit: int) -> tuple:
+    '''Снимает порцию истёкших; возвращает (предложений, продавцов)'''
+    cur.execute(EXPIRE_CHUNK_SQL, {'limit': limit})
+    expired, sellers, item_names = cur.fetchone()
+    # Строки сводки этих предметов уже заблокированы запросом снятия
+    refresh_floor(cur, item_names)
+    return expired, sellers
+
+
+def archive_chunk(cur, limit: int, keep: float) -> tuple:
+    '''Переносит порцию закрытых в архив; возвращает (перенесено, заменено в архиве)'''
+    cur.execute(ARCHIVE_CHUNK_SQL, {'limit': limit, 'keep': keep})
+    return cur.fetchone()
@@ -0,0 +1,161 @@
+'''Пул соединений с Postgres, переживающий тёплые вызовы функции'''
+
+import json
+import os
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from timing import TimedConnection, phase
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+POOL_CHECK_AFTER = float(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get('DB_POOL_ACQUIRE_TIMEOUT', '10'))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class ConnectionPool:
+    '''Ограниченный пул: выдача последнего возвращённого соединения, проверка живости, вытеснение простаивающих'''
+
+    def __init__(self, dsn: str = None, max_size: int = POOL_MAX_SIZE,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT, check_after: float = POOL_CHECK_AFTER,
+                 connection_factory=None):
+        self.dsn = dsn
+        self.connection_factory = connection_factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.broken = 0
+        self.connect_seconds = 0.0
+
+    def getconn(self):
+        with phase('connect'):
+            return self._getconn()
+
+    def _getconn(self):
+        with self._cond:
+            deadline = time.monotonic() + POOL_ACQUIRE_TIMEOUT
+            while self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted(f'Все {self.max_size} соединений заняты')
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self._evict_idle()
+
+        try:
+            while True:
+                with self._cond:
+                    if not self._idle:
+                        break
+                    conn, released_at = self._idle.pop()
+                if self._is_alive(conn, released_at):
+                    self.hits += 1
+                    return conn
+                self.broken += 1
+                self._close(conn)
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn) -> None:
+        keep = not conn.closed
+        if keep:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                keep = False
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    keep = False
+        if not keep:
+            self.broken += 1
+
+        with self._cond:
+            self._in_use -= 1
+            if keep and len(self._idle) < self.max_size:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._close(conn)
+
+    def closeall(self) -> None:
+        '''Закрывает простаивающие соединения; занятые закроются при возврате'''
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self.max_size = 0
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        avg_connect = self.connect_seconds / self.misses if self.misses else 0.0
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted': self.evicted,
+            'broken': self.broken,
+            'idle': len(self._idle),
+            'in_use': self._in_use,
+            'avg_connect_ms': round(avg_connect * 1000, 2),
+            'saved_ms': round(self.hits * avg_connect * 1000, 2)
+        }
+
+    def _connect(self):
+        started = time.perf_counter()
+        conn = psycopg2.connect(self.dsn or os.environ['DATABASE_URL'], connection_factory=self.connection_factory)
+        self.connect_seconds += time.perf_counter() - started
+        self.misses += 1
+        print(json.dumps({'event': 'db_pool_connect', **self.stats()}))
+        return conn
+
+    def _is_alive(self, conn, released_at: float) -> bool:
+        if conn.closed:
+            return False
+        try:
+            # При каждой выдаче и без обращения к серверу: poll() дочитывает из сокета
+            # то, что уже пришло, и падает, если сервер закрыл соединение (рестарт,
+            # idle_session_timeout, разрыв у балансировщика)
+            conn.poll()
+            if time.monotonic() - released_at >= self.check_after:
+                # Долго простоявшее соединение проверяется запросом: обрыв сети без
+                # закрытия сокета poll() не заметит
+                with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.pop(0)
+            self.evicted += 1
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+pool = ConnectionPool(connection_factory=TimedConnection)
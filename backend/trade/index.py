@@ -1,8 +1,41 @@
 import json
-import os
-import psycopg2
-from datetime import datetime
 
+from db import pool
+from idempotency import claim, remember
+from listing import listing_query, next_cursor, parse_listing_params
+from offers import create_offer
+from pricing import MAX_PRICE_ITEMS, fetch_prices
+from purchase import CONTENTION, purchase
+from ratelimit import take
+from timing import dumps, instrumented
+from tokens import authenticate
+
+PURCHASE_ERRORS = {
+    'not_found': (404, 'Предложение не найдено'),
+    'sold': (409, 'Предложение уже продано'),
+    'expired': (410, 'Срок предложения истёк'),
+    'own_offer': (400, 'Нельзя купить собственное предложение'),
+    'no_funds': (400, 'Недостаточно монет'),
+    'conflict': (409, 'Предложение только что купил другой игрок')
+}
+
+# (запас, пополнение в секунду) на пользователя и действие
+RATE_LIMITS = {
+    'buy': (10, 0.5),
+    'create_offer': (5, 0.2)
+}
+
+
+def get_header(event: dict, name: str) -> str:
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+@instrumented('trade', extra=lambda: {'pool': pool.stats(), 'purchases': CONTENTION})
 def handler(event: dict, context) -> dict:
     '''API для торговли предметами между игроками'''
     
@@ -14,37 +47,58 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
+                'Access-Control-Allow-Headers': 'Content-Type, Authorization, Idempotency-Key'
             },
             'body': ''
         }
     
+    conn = None
+    cur = None
     try:
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = pool.getconn()
         cur = conn.cursor()
         
         if method == 'GET':
-            params = event.get('queryStringParameters', {})
-            user_id = params.get('user_id')
+            params = dict(event.get('queryStringParameters') or {})
+            
+            if params.get('action') == 'prices':
+                items = [name.strip() for name in (params.get('items') or '').split(',') if name.strip()]
+                try:
+                    limit = max(1, min(int(params.get('limit') or MAX_PRICE_ITEMS), MAX_PRICE_ITEMS))
+                except ValueError:
+                    limit = MAX_PRICE_ITEMS
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'prices': fetch_prices(cur, items, limit)})
+                }
+            
+            if get_header(event, 'Authorization'):
+                user_id, auth_error = authenticate(get_header(event, 'Authorization'), params.get('user_id'), cur)
+                if auth_error:
+                    return {
+                        'statusCode': auth_error[0],
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': dumps({'error': auth_error[1]})
+                    }
+                params['user_id'] = user_id
+            
+            try:
+                filters = parse_listing_params(params)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'error': f'Неверные параметры: {str(e)}'})
+                }
             
-            cur.execute(
-                """
-                SELECT t.id, t.item_name, t.item_type, t.effect, t.price, t.status, 
-                       u.username as seller_name, t.seller_id
-                FROM trade_offers t
-                JOIN users u ON t.seller_id = u.id
-                WHERE t.status = 'active' AND t.seller_id != %s
-                ORDER BY t.created_at DESC
-                LIMIT 20
-                """,
-                (user_id or 0,)
-            )
+            cur.execute(*listing_query(filters))
             offers = cur.fetchall()
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({
+                'body': dumps({
                     'offers': [
                         {
                             'id': o[0],
@@ -54,9 +108,11 @@ def handler(event: dict, context) -> dict:
                             'price': o[4],
                             'status': o[5],
                             'seller_name': o[6],
-                            'seller_id': o[7]
-                        } for o in offers
-                    ]
+                            'seller_id': o[7],
+                            'expires_at': o[9].isoformat() if o[9] else None
+                        } for o in offers[:filters['limit']]
+                    ],
+                    'next_cursor': next_cursor(offers, filters['limit'])
                 })
             }
         
@@ -64,49 +120,84 @@ def handler(event: dict, context) -> dict:
             body = json.loads(event.get('body', '{}'))
             action = body.get('action')
             
+            user_id, auth_error = authenticate(get_header(event, 'Authorization'), body.get('user_id'), cur)
+            
+            if auth_error:
+                return {
+                    'statusCode': auth_error[0],
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': dumps({'error': auth_error[1]})
+                }
+            
+            body['user_id'] = user_id
+            idempotency_key = get_header(event, 'Idempotency-Key')
+            
+            if action in RATE_LIMITS and user_id:
+                # Повтор с тем же ключом отдаёт сохранённый ответ и не тратит лимит
+                if idempotency_key:
+                    replay, idempotency_error = claim(cur, 'trade', user_id, idempotency_key, event.get('body'))
+                    if idempotency_error:
+                        return {
+                            'statusCode': idempotency_error[0],
+                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                            'body': dumps({'error': idempotency_error[1]})
+                        }
+                    if replay:
+                        return {
+                            'statusCode': replay[0],
+                            'headers': {
+                                'Content-Type': 'application/json',
+                                'Idempotent-Replayed': 'true',
+                                'Access-Control-Allow-Origin': '*'
+                            },
+                            'body': replay[1]
+                        }
+                
+                retry_after = take(user_id, action, RATE_LIMITS[action])
+                
+                if retry_after:
+                    conn.rollback()
+                    return {
+                        'statusCode': 429,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Retry-After': str(int(retry_after) + 1),
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': dumps({'error': 'Слишком много запросов, попробуйте позже'})
+                    }
+            
             if action == 'create_offer':
                 seller_id = body.get('user_id')
                 item_name = body.get('item_name')
-                item_type = body.get('item_type')
-                effect = body.get('effect')
                 price = body.get('price')
                 
                 if not all([seller_id, item_name, price]):
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Недостаточно данных'})
+                        'body': dumps({'error': 'Недостаточно данных'})
                     }
                 
-                cur.execute(
-                    "SELECT quantity FROM inventory WHERE user_id = %s AND item_name = %s",
-                    (seller_id, item_name)
-                )
-                inv = cur.fetchone()
+                offer_id = create_offer(cur, seller_id, item_name, price)
                 
-                if not inv or inv[0] < 1:
+                if not offer_id:
+                    conn.rollback()
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Предмет не найден в инвентаре'})
+                        'body': dumps({'error': 'Предмет не найден в инвентаре'})
                     }
                 
-                cur.execute(
-                    "UPDATE inventory SET quantity = quantity - 1 WHERE user_id = %s AND item_name = %s",
-                    (seller_id, item_name)
-                )
-                
-                cur.execute(
-                    "INSERT INTO trade_offers (seller_id, item_name, item_type, effect, price) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-                    (seller_id, item_name, item_type, effect, price)
-                )
-                offer_id = cur.fetchone()[0]
+                response_body = dumps({'success': True, 'offer_id': offer_id})
+                if idempotency_key:
+                    remember(cur, 'trade', seller_id, idempotency_key, 200, response_body)
                 conn.commit()
                 
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'success': True, 'offer_id': offer_id})
+                    'body': response_body
                 }
             
             elif action == 'buy':
@@ -117,67 +208,45 @@ def handler(event: dict, context) -> dict:
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Недостаточно данных'})
+                        'body': dumps({'error': 'Недостаточно данных'})
                     }
                 
-                cur.execute(
-                    "SELECT seller_id, item_name, item_type, effect, price FROM trade_offers WHERE id = %s AND status = 'active'",
-                    (offer_id,)
-                )
-                offer = cur.fetchone()
+                outcome, coins = purchase(cur, buyer_id, offer_id)
                 
-                if not offer:
+                if outcome != 'ok':
+                    conn.rollback()
+                    status, error = PURCHASE_ERRORS[outcome]
                     return {
-                        'statusCode': 404,
+                        'statusCode': status,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Предложение не найдено'})
+                        'body': dumps({'error': error})
                     }
                 
-                cur.execute("SELECT coins FROM users WHERE id = %s", (buyer_id,))
-                buyer_coins = cur.fetchone()[0]
-                
-                if buyer_coins < offer[4]:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Недостаточно монет'})
-                    }
-                
-                cur.execute("UPDATE users SET coins = coins - %s WHERE id = %s", (offer[4], buyer_id))
-                cur.execute("UPDATE users SET coins = coins + %s WHERE id = %s", (offer[4], offer[0]))
-                
-                cur.execute(
-                    "INSERT INTO inventory (user_id, item_name, item_type, effect) VALUES (%s, %s, %s, %s)",
-                    (buyer_id, offer[1], offer[2], offer[3])
-                )
-                
-                cur.execute(
-                    "UPDATE trade_offers SET status = 'completed', buyer_id = %s, completed_at = %s WHERE id = %s",
-                    (buyer_id, datetime.now(), offer_id)
-                )
-                
+                response_body = dumps({'success': True, 'message': 'Покупка совершена', 'coins': coins})
+                if idempotency_key:
+                    remember(cur, 'trade', buyer_id, idempotency_key, 200, response_body)
                 conn.commit()
                 
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'success': True, 'message': 'Покупка совершена'})
+                    'body': response_body
                 }
         
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Метод не поддерживается'})
+            'body': dumps({'error': 'Метод не поддерживается'})
         }
         
     except Exception as e:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Ошибка сервера: {str(e)}'})
+            'body': dumps({'error': f'Ошибка сервера: {str(e)}'})
         }
     finally:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            pool.putconn(conn)
@@ -0,0 +1,80 @@
+'''Лента торговых предложений с курсорной (keyset) пагинацией и фильтрами
+
+Страница продолжается строго после последней показанной пары (created_at, id), поэтому
+Postgres идёт по частичному индексу активных предложений и читает ровно одну страницу,
+сколько бы предложений ни было на рынке.
+'''
+
+import base64
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: datetime, offer_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{offer_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, offer_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(offer_id)
+
+
+def parse_listing_params(params: dict) -> dict:
+    '''Разбирает параметры запроса; при ошибке бросает ValueError'''
+    limit = int(params.get('limit') or DEFAULT_PAGE_SIZE)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit должен быть от 1 до {MAX_PAGE_SIZE}')
+    return {
+        'user_id': params.get('user_id') or 0,
+        'limit': limit,
+        'cursor': decode_cursor(params['cursor']) if params.get('cursor') else None,
+        'item_type': params.get('item_type') or None,
+        'item_name': params.get('item_name') or None,
+        'min_price': int(params['min_price']) if params.get('min_price') else None,
+        'max_price': int(params['max_price']) if params.get('max_price') else None
+    }
+
+
+def listing_query(filters: dict) -> tuple:
+    conditions = ["t.status = 'active'", '(t.expires_at IS NULL OR t.expires_at > LOCALTIMESTAMP)', 't.seller_id != %s']
+    args = [filters['user_id']]
+
+    if filters['cursor']:
+        conditions.append('(t.created_at, t.id) < (%s, %s)')
+        args.extend(filters['cursor'])
+    if filters['item_type']:
+        conditions.append('t.item_type = %s')
+        args.append(filters['item_type'])
+    if filters['item_name']:
+        conditions.append('t.item_name = %s')
+        args.append(filters['item_name'])
+    if filters['min_price'] is not None:
+        conditions.append('t.price >= %s')
+        args.append(filters['min_price'])
+    if filters['max_price'] is not None:
+        conditions.append('t.price <= %s')
+        args.append(filters['max_price'])
+
+    # Берём на одну строку больше страницы, чтобы узнать, есть ли следующая
+    args.append(filters['limit'] + 1)
+    sql = f"""
+        SELECT t.id, t.item_name, t.item_type, t.effect, t.price, t.status,
+               u.username as seller_name, t.seller_id, t.created_at, t.expires_at
+        FROM trade_offers t
+        JOIN users u ON t.seller_id = u.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY t.created_at DESC, t.id DESC
+        LIMIT %s
+    """
+    return sql, args
+
+
+def next_cursor(rows: list, limit: int) -> str:
+    if len(rows) <= limit:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(last[8], last[0])
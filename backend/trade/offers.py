@@ -0,0 +1,39 @@
+'''Выставление предмета на продажу
+
+Предмет списывается из стопки инвентаря условным UPDATE (quantity > 0), и предложение
+создаётся в том же запросе вместе с обновлением сводки цен (см. pricing.py). Тип и эффект
+берутся из инвентаря, а не из запроса клиента. Предложение живёт OFFER_TTL_HOURS, после
+чего scripts/archive_offers.py возвращает предмет продавцу (см. archive.py).
+'''
+
+import os
+
+from pricing import LISTING_STATS_CTE
+
+OFFER_TTL_HOURS = float(os.environ.get('OFFER_TTL_HOURS', '72'))
+
+CREATE_OFFER_SQL = """
+    WITH taken AS (
+        UPDATE inventory SET quantity = quantity - 1
+        WHERE user_id = %(seller_id)s AND item_name = %(item_name)s AND quantity > 0
+        RETURNING item_name, item_type, effect
+    ), offer AS (
+        INSERT INTO trade_offers (seller_id, item_name, item_type, effect, price, expires_at)
+        SELECT %(seller_id)s, item_name, item_type, effect, %(price)s,
+               LOCALTIMESTAMP + make_interval(secs => %(ttl)s) FROM taken
+        RETURNING id
+    ), account AS (
+        UPDATE users SET state_version = state_version + 1
+        WHERE id = %(seller_id)s AND EXISTS (SELECT 1 FROM taken)
+    ), PRICE_STATS
+    SELECT id FROM offer
+""".replace('PRICE_STATS', LISTING_STATS_CTE)
+
+
+def create_offer(cur, seller_id, item_name: str, price) -> int:
+    '''Возвращает id нового предложения или None, если предмета нет в инвентаре'''
+    cur.execute(CREATE_OFFER_SQL, {
+        'seller_id': seller_id, 'item_name': item_name, 'price': price, 'ttl': OFFER_TTL_HOURS * 3600
+    })
+    row = cur.fetchone()
+    return row[0] if row else None
@@ -0,0 +1,173 @@
+'''Сводка цен по предметам, обновляемая внутри покупки и выставления
+
+Вместо агрегации по всей истории trade_offers каждая сделка сдвигает строку
+item_price_stats: последняя цена, экспоненциальное скользящее среднее с весом
+PRICE_AVG_WEIGHT, число продаж, оборот, число активных предложений и минимальная
+цена среди них. Выставление снижает минимум в том же запросе; после покупки и снятия
+по сроку он пересчитывается отдельным запросом FLOOR_SQL по индексу (item_name, price).
+'''
+
+from decimal import ROUND_HALF_UP, Decimal
+
+PRICE_AVG_WEIGHT = Decimal('0.2')
+MAX_PRICE_ITEMS = 50
+
+# CTE для PURCHASE_SQL: claim — захваченное предложение. Минимум здесь не трогается:
+# снимок запроса взят до блокировки строки сводки и не видит параллельных покупок,
+# поэтому его обновляет FLOOR_SQL следующим запросом той же транзакции.
+SALE_STATS_CTE = f"""price_stats AS (
+        INSERT INTO item_price_stats AS s
+            (item_name, last_price, avg_price, sales, volume, active_offers, floor_price, last_sale_at, updated_at)
+        SELECT c.item_name, c.price, c.price, 1, c.price, 0, NULL, LOCALTIMESTAMP, LOCALTIMESTAMP
+        FROM claim c
+        ON CONFLICT (item_name) DO UPDATE SET
+            last_price = EXCLUDED.last_price,
+            avg_price = CASE WHEN s.sales = 0 OR s.avg_price IS NULL THEN EXCLUDED.avg_price
+                             ELSE ROUND(s.avg_price + {PRICE_AVG_WEIGHT} * (EXCLUDED.last_price - s.avg_price), 2) END,
+            sales = s.sales + 1,
+            volume = s.volume + EXCLUDED.volume,
+            active_offers = GREATEST(s.active_offers - 1, 0),
+            last_sale_at = EXCLUDED.last_sale_at,
+            updated_at = EXCLUDED.updated_at
+    )"""
+
+# Минимальная цена активных предложений заново. Выполняется отдельным запросом, когда
+# транзакция уже держит блокировку строк сводки: в READ COMMITTED его снимок видит все
+# покупки, закоммиченные раньше, а незакоммиченные ждут этой блокировки и пересчитают
+# минимум сами. Строка пишется, только если минимум изменился.
+FLOOR_SQL = """
+    UPDATE item_price_stats s
+    SET floor_price = f.price, updated_at = LOCALTIMESTAMP
+    FROM (
+        SELECT n.item_name,
+               (SELECT MIN(t.price) FROM trade_offers t
+                WHERE t.item_name = n.item_name AND t.status = 'active') AS price
+        FROM unnest(%s::VARCHAR[]) AS n(item_name)
+    ) f
+    WHERE s.item_name = f.item_name AND s.floor_price IS DISTINCT FROM f.price
+"""
+
+# CTE для CREATE_OFFER_SQL: taken — списанный из инвентаря предмет
+LISTING_STATS_CTE = """price_stats AS (
+        INSERT INTO item_price_stats AS s (item_name, active_offers, floor_price, updated_at)
+        SELECT item_name, 1, %(price)s, LOCALTIMESTAMP FROM taken
+        ON CONFLICT (item_name) DO UPDATE SET
+            active_offers = s.active_offers + 1,
+            floor_price = LEAST(s.floor_price, EXCLUDED.floor_price),
+            updated_at = EXCLUDED.updated_at
+    )"""
+
+# CTE для EXPIRE_CHUNK_SQL (archive.py): expired — снятые по сроку предложения. Как и
+# при покупке, минимум пересчитывает FLOOR_SQL следующим запросом.
+EXPIRY_STATS_CTE = """price_stats AS (
+        UPDATE item_price_stats s
+        SET active_offers = GREATEST(s.active_offers - e.offers, 0),
+            updated_at = LOCALTIMESTAMP
+        FROM (SELECT item_name, COUNT(*) AS offers FROM expired GROUP BY item_name) e
+        WHERE s.item_name = e.item_name
+    )"""
+
+PRICES_SQL = """
+    SELECT item_name, last_price, avg_price, sales, volume, active_offers, floor_price, last_sale_at
+    FROM item_price_stats
+    WHERE item_name = ANY(%s)
+    ORDER BY item_name
+"""
+
+TOP_PRICES_SQL = """
+    SELECT item_name, last_price, avg_price, sales, volume, active_offers, floor_price, last_sale_at
+    FROM item_price_stats
+    ORDER BY volume DESC, item_name
+    LIMIT %s
+"""
+
+# Перестроение из истории: порция предметов по возрастанию имени, строки сводки
+# порции блокируются, чтобы покупки и выставления этих предметов дождались записи
+REBUILD_NAMES_SQL = """
+    SELECT item_name FROM (
+        SELECT item_name FROM trade_offers WHERE item_name > %(after)s
+        UNION
+        SELECT item_name FROM trade_offers_history WHERE item_name > %(after)s
+        UNION
+        SELECT item_name FROM item_price_stats WHERE item_name > %(after)s
+    ) names
+    ORDER BY item_name
+    LIMIT %(limit)s
+"""
+
+REBUILD_LOCK_SQL = "SELECT item_name FROM item_price_stats WHERE item_name = ANY(%s) ORDER BY item_name FOR UPDATE"
+
+REBUILD_SALES_SQL = """
+    SELECT item_name, price, completed_at FROM (
+        SELECT id, item_name, price, completed_at FROM trade_offers_history
+        WHERE status = 'completed' AND item_name = ANY(%(names)s)
+        UNION ALL
+        SELECT id, item_name, price, completed_at FROM trade_offers
+        WHERE status = 'completed' AND item_name = ANY(%(names)s)
+    ) sales
+    ORDER BY item_name, completed_at, id
+"""
+
+REBUILD_ACTIVE_SQL = """
+    SELECT item_name, COUNT(*), MIN(price)
+    FROM trade_offers
+    WHERE status = 'active' AND item_name = ANY(%s)
+    GROUP BY item_name
+"""
+
+REBUILD_UPSERT_SQL = """
+    INSERT INTO item_price_stats AS s
+        (item_name, last_price, avg_price, sales, volume, active_offers, floor_price, last_sale_at, updated_at)
+    SELECT r.*, LOCALTIMESTAMP
+    FROM unnest(%s::VARCHAR[], %s::INTEGER[], %s::NUMERIC[], %s::INTEGER[], %s::BIGINT[],
+                %s::INTEGER[], %s::INTEGER[], %s::TIMESTAMP[]) AS r
+    ON CONFLICT (item_name) DO UPDATE SET
+        last_price = EXCLUDED.last_price,
+        avg_price = EXCLUDED.avg_price,
+        sales = EXCLUDED.sales,
+        volume = EXCLUDED.volume,
+        active_offers = EXCLUDED.active_offers,
+        floor_price = EXCLUDED.floor_price,
+        last_sale_at = EXCLUDED.last_sale_at,
+        updated_at = EXCLUDED.updated_at
+    WHERE (s.last_price, s.avg_price, s.sales, s.volume, s.active_offers, s.floor_price, s.last_sale_at)
+          IS DISTINCT FROM (EXCLUDED.last_price, EXCLUDED.avg_price, EXCLUDED.sales, EXCLUDED.volume,
+                            EXCLUDED.active_offers, EXCLUDED.floor_price, EXCLUDED.last_sale_at)
+"""
+
+
+def ewma(prices) -> Decimal:
+    '''Скользящее среднее той же формулой, что и SALE_STATS_CTE, с тем же округлением'''
+    average = None
+    for price in prices:
+        if average is None:
+            average = Decimal(price)
+        else:
+            average = (average + PRICE_AVG_WEIGHT * (price - average)).quantize(Decimal('0.01'), ROUND_HALF_UP)
+    return average
+
+
+def refresh_floor(cur, item_names: list) -> None:
+    '''Пересчитывает floor_price предметов; строки сводки должны быть уже заблокированы'''
+    if item_names:
+        cur.execute(FLOOR_SQL, (list(item_names),))
+
+
+def fetch_prices(cur, item_names: list, limit: int = MAX_PRICE_ITEMS) -> list:
+    if item_names:
+        cur.execute(PRICES_SQL, (item_names[:MAX_PRICE_ITEMS],))
+    else:
+        cur.execute(TOP_PRICES_SQL, (limit,))
+    return [
+        {
+            'item_name': row[0],
+            'last_price': row[1],
+            'avg_price': float(row[2]) if row[2] is not None else None,
+            'sales': row[3],
+            'volume': row[4],
+            'active_offers': row[5],
+            'floor_price': row[6],
+            'last_sale_at': row[7].isoformat() if row[7] else None
+        }
+        for row in cur.fetchall()
+    ]
@@ -0,0 +1,105 @@
+'''Атомарная покупка предложения одним запросом
+
+Предложение захватывается условным UPDATE (status = 'active' → 'completed'): из двух
+одновременных покупателей строку получает только один, второй видит ноль строк без
+ожидания долгих блокировок. Списание и зачисление монет, выдача предмета и смена версий
+состояния выполняются в том же запросе, блокировки держатся до ближайшего commit.
+Продавец получает уведомление sold через NOTIFY (см. notify.py), сводка цен предмета
+сдвигается там же, а её минимальная цена — следующим запросом (см. pricing.py).
+'''
+
+import json
+
+import psycopg2.errors
+
+from notify import notify_sql
+from pricing import SALE_STATS_CTE, refresh_floor
+
+PURCHASE_SQL = """
+    WITH claim AS (
+        UPDATE trade_offers
+        SET status = 'completed', buyer_id = %(buyer_id)s, completed_at = LOCALTIMESTAMP
+        WHERE id = %(offer_id)s AND status = 'active' AND seller_id != %(buyer_id)s
+          AND (expires_at IS NULL OR expires_at > LOCALTIMESTAMP)
+          AND price <= (SELECT coins FROM users WHERE id = %(buyer_id)s)
+        RETURNING seller_id, item_name, item_type, effect, price
+    ), accounts AS (
+        UPDATE users u
+        SET coins = u.coins + CASE WHEN u.id = %(buyer_id)s THEN -c.price ELSE c.price END,
+            state_version = u.state_version + 1
+        FROM claim c
+        WHERE u.id IN (%(buyer_id)s, c.seller_id)
+          AND (u.id != %(buyer_id)s OR u.coins >= c.price)
+        RETURNING u.id, u.coins
+    ), item AS (
+        INSERT INTO inventory (user_id, item_name, item_type, effect)
+        SELECT %(buyer_id)s, item_name, item_type, effect FROM claim
+        ON CONFLICT (user_id, item_name) DO UPDATE SET quantity = inventory.quantity + EXCLUDED.quantity
+    ), PRICE_STATS
+    SELECT
+        (SELECT COUNT(*) FROM claim),
+        (SELECT COUNT(*) FROM accounts),
+        (SELECT coins FROM accounts WHERE id = %(buyer_id)s),
+        o.status, o.seller_id, o.price, b.coins, o.expires_at <= LOCALTIMESTAMP, o.item_name,
+        (SELECT NOTIFY_SOLD FROM claim c)
+    FROM (SELECT 1) AS one
+    LEFT JOIN trade_offers o ON o.id = %(offer_id)s
+    LEFT JOIN users b ON b.id = %(buyer_id)s
+""".replace('PRICE_STATS', SALE_STATS_CTE).replace('NOTIFY_SOLD', notify_sql(
+    "json_build_object('t', 'sold', 'u', c.seller_id, 'offer_id', %(offer_id)s::INTEGER, "
+    "'item_name', c.item_name, 'price', c.price, "
+    "'coins', (SELECT coins FROM accounts WHERE id = c.seller_id))"
+))
+
+# Счётчики живут в тёплом контейнере и пишутся в лог при каждом конфликте
+CONTENTION = {
+    'attempts': 0,
+    'completed': 0,
+    'claim_conflicts': 0,
+    'funds_conflicts': 0,
+    'deadlocks': 0
+}
+
+
+def _conflict(kind: str) -> None:
+    CONTENTION[kind] += 1
+    print(json.dumps({'event': 'trade_contention', 'kind': kind, **CONTENTION}))
+
+
+def purchase(cur, buyer_id, offer_id) -> tuple:
+    '''Пытается купить предложение; возвращает (исход, остаток монет покупателя)
+
+    Исходы: ok, not_found, sold, expired, own_offer, no_funds, conflict. При любом исходе,
+    кроме ok, вызывающий должен откатить транзакцию.
+    '''
+    CONTENTION['attempts'] += 1
+    try:
+        cur.execute(PURCHASE_SQL, {'buyer_id': buyer_id, 'offer_id': offer_id})
+    except (psycopg2.errors.DeadlockDetected, psycopg2.errors.SerializationFailure):
+        _conflict('deadlocks')
+        return 'conflict', None
+
+    claimed, accounts, coins, status, seller_id, price, buyer_coins, expired, item_name, _ = cur.fetchone()
+
+    if claimed and accounts == 2:
+        CONTENTION['completed'] += 1
+        # Строка сводки уже заблокирована запросом покупки
+        refresh_floor(cur, [item_name])
+        return 'ok', coins
+    if claimed:
+        # Предложение захвачено, но параллельная покупка уже потратила монеты покупателя
+        _conflict('funds_conflicts')
+        return 'no_funds', None
+    if status is None:
+        return 'not_found', None
+    if status == 'expired' or (status == 'active' and expired):
+        return 'expired', None
+    if status != 'active':
+        return 'sold', None
+    if str(seller_id) == str(buyer_id):
+        return 'own_offer', None
+    if buyer_coins is None or buyer_coins < price:
+        return 'no_funds', None
+    # По снимку предложение было активно, но его захватил другой покупатель
+    _conflict('claim_conflicts')
+    return 'conflict', None
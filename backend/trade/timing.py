@@ -0,0 +1,132 @@
+'''Инструментирование горячего пути: фазы запроса, время каждого SQL, холодный/тёплый старт
+
+Декоратор instrumented оборачивает handler, собирает время фаз (connect, db, commit,
+serialize и любых своих через phase) и отдаёт его в заголовке Server-Timing и одной
+JSON-строкой в лог. Запросы к базе замеряются курсором TimedCursor, который пул
+подключает через connection_factory.
+'''
+
+import contextvars
+import functools
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import psycopg2.extensions
+except ImportError:
+    psycopg2 = None
+
+MAX_TIMING_QUERIES = 10
+
+_current = contextvars.ContextVar('request_timer', default=None)
+_state = {'warm': False}
+
+
+class RequestTimer:
+    def __init__(self, cold: bool):
+        self.cold = cold
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.queries = []
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_query(self, sql, seconds: float) -> None:
+        if isinstance(sql, bytes):
+            sql = sql.decode(errors='replace')
+        label = ' '.join(str(sql).split())[:80]
+        self.queries.append((label, seconds))
+        self.add_phase('db', seconds)
+
+    def server_timing(self, total: float) -> str:
+        entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.phases.items()]
+        # Только номер запроса: заголовок виден любому источнику, текст SQL остаётся в логе
+        for index, (_, seconds) in enumerate(self.queries[:MAX_TIMING_QUERIES]):
+            entries.append(f'q{index};dur={seconds * 1000:.2f}')
+        entries.append(f'total;dur={total * 1000:.2f}')
+        entries.append('cold' if self.cold else 'warm')
+        return ', '.join(entries)
+
+    def log_record(self, function_name: str, status, total: float) -> dict:
+        return {
+            'event': 'request_timing',
+            'function': function_name,
+            'status': status,
+            'cold': self.cold,
+            'total_ms': round(total * 1000, 2),
+            'phases_ms': {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()},
+            'queries': [{'sql': label, 'ms': round(seconds * 1000, 2)} for label, seconds in self.queries]
+        }
+
+
+@contextmanager
+def phase(name: str):
+    '''Замеряет блок как фазу текущего запроса; вне instrumented ничего не делает'''
+    timer = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add_phase(name, time.perf_counter() - started)
+
+
+def dumps(payload) -> str:
+    with phase('serialize'):
+        return json.dumps(payload)
+
+
+def instrumented(function_name: str, extra=None):
+    '''Декоратор handler: Server-Timing в ответе и строка request_timing в логе
+
+    extra — функция без аргументов, чей словарь добавляется в строку лога
+    (например, статистика пула соединений).
+    '''
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            timer = RequestTimer(cold=not _state['warm'])
+            _state['warm'] = True
+            token = _current.set(timer)
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                _current.reset(token)
+                total = time.perf_counter() - timer.started
+                if isinstance(response, dict):
+                    headers = response.setdefault('headers', {})
+                    headers['Server-Timing'] = timer.server_timing(total)
+                    headers['Timing-Allow-Origin'] = '*'
+                    exposed = headers.get('Access-Control-Expose-Headers')
+                    headers['Access-Control-Expose-Headers'] = f'{exposed}, Server-Timing' if exposed else 'Server-Timing'
+                record = timer.log_record(function_name, response.get('statusCode') if isinstance(response, dict) else 'exception', total)
+                if extra is not None:
+                    record['extra'] = extra()
+                print(json.dumps(record))
+        return wrapper
+    return decorate
+
+
+if psycopg2 is not None:
+    class TimedCursor(psycopg2.extensions.cursor):
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                timer = _current.get()
+                if timer is not None:
+                    timer.add_query(query, time.perf_counter() - started)
+
+    class TimedConnection(psycopg2.extensions.connection):
+        def cursor(self, *args, **kwargs):
+            kwargs.setdefault('cursor_factory', TimedCursor)
+            return super().cursor(*args, **kwargs)
+
+        def commit(self):
+            with phase('commit'):
+                return super().commit()
@@ -0,0 +1,116 @@
+'''Подписанные токены сессии, проверяемые без обращения к базе
+
+Токен — base64url(JSON с uid, exp, jti) и HMAC-SHA256 подпись через точку. Проверка
+занимает микросекунды и не требует таблицы сессий. Если включён TOKEN_REVOCATION,
+список отозванных jti подгружается из revoked_tokens не чаще раза в
+TOKEN_REVOCATION_TTL секунд и хранится в тёплом контейнере.
+
+Ключ подписи — обязательная переменная окружения SESSION_SECRET. Старые токены без
+подписи (до перехода на подписанные сессии), пока не включён REQUIRE_AUTH, считаются
+отсутствующими: запрос идёт по user_id, как раньше.
+'''
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+TOKEN_TTL = int(os.environ.get('TOKEN_TTL', str(30 * 24 * 3600)))
+TOKEN_REVOCATION = os.environ.get('TOKEN_REVOCATION', '') == '1'
+TOKEN_REVOCATION_TTL = float(os.environ.get('TOKEN_REVOCATION_TTL', '60'))
+REQUIRE_AUTH = os.environ.get('REQUIRE_AUTH', '') == '1'
+
+_revoked = {'jtis': frozenset(), 'loaded_at': float('-inf')}
+
+
+class TokenConfigError(Exception):
+    pass
+
+
+def secret_configured() -> bool:
+    return bool(os.environ.get('SESSION_SECRET'))
+
+
+def _secret() -> bytes:
+    if not secret_configured():
+        raise TokenConfigError('Не задан SESSION_SECRET')
+    return os.environ['SESSION_SECRET'].encode()
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(body: str) -> str:
+    return _b64encode(hmac.new(_secret(), body.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, ttl: int = TOKEN_TTL) -> str:
+    payload = {'uid': user_id, 'exp': int(time.time()) + ttl, 'jti': secrets.token_urlsafe(9)}
+    body = _b64encode(json.dumps(payload, separators=(',', ':')).encode())
+    return f'{body}.{_sign(body)}'
+
+
+def verify_token(token: str, cur=None) -> dict:
+    '''Возвращает содержимое токена или None, если подпись, срок или отзыв не прошли'''
+    body, _, signature = token.partition('.')
+    if not signature or not hmac.compare_digest(signature, _sign(body)):
+        return None
+    try:
+        claims = json.loads(_b64decode(body))
+    except ValueError:
+        return None
+    if claims.get('exp', 0) < time.time():
+        return None
+    if TOKEN_REVOCATION and cur is not None and claims.get('jti') in revoked_jtis(cur):
+        return None
+    return claims
+
+
+def revoked_jtis(cur) -> frozenset:
+    now = time.monotonic()
+    if now - _revoked['loaded_at'] > TOKEN_REVOCATION_TTL:
+        cur.execute("SELECT jti FROM revoked_tokens WHERE expires_at > LOCALTIMESTAMP")
+        _revoked['jtis'] = frozenset(row[0] for row in cur.fetchall())
+        _revoked['loaded_at'] = now
+    return _revoked['jtis']
+
+
+def bearer_token(authorization: str) -> str:
+    if authorization and authorization.lower().startswith('bearer '):
+        return authorization[7:].strip()
+    return authorization
+
+
+def is_signed(token: str) -> bool:
+    return '.' in token
+
+
+def authenticate(authorization: str, claimed_user_id, cur) -> tuple:
+    '''Определяет пользователя запроса: (user_id, None) или (None, (статус, ошибка))
+
+    Без токена (или со старым неподписанным) user_id из запроса принимается, пока не
+    включён REQUIRE_AUTH.
+    '''
+    token = bearer_token(authorization)
+    if token and not is_signed(token) and not REQUIRE_AUTH:
+        token = None
+    if not token:
+        if REQUIRE_AUTH:
+            return None, (401, 'Требуется авторизация')
+        return claimed_user_id, None
+    if not secret_configured():
+        return None, (503, 'Авторизация не настроена: не задан SESSION_SECRET')
+    claims = verify_token(token, cur)
+    if not claims:
+        return None, (401, 'Недействительный токен')
+    if claimed_user_id and str(claimed_user_id) != str(claims['uid']):
+        return None, (403, 'Токен выдан другому пользователю')
+    return claims['uid'], None
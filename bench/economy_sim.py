@@ -0,0 +1,271 @@
+'''Офлайн-симуляция экономики питомцев для баланса и планирования мощности
+
+Шагает синтетических питомцев (миллионы за раз) по тикам затухания векторно на NumPy:
+затухание из pet_decay_rates, действия и ограничения из ACTIONS, STAT_MIN и STAT_MAX
+обработчика pet, пороги уровней из level_thresholds, квесты из quest_definitions,
+множители событий в процентах. Игроки заходят сессиями по закону Пуассона с суточным
+профилем и чинят самую просевшую характеристику. На выходе JSON: кривые опыта и
+уровней по часам, денежная масса и её прирост, действия на игрока в час и прогноз
+запросов и записываемых строк в секунду. База не нужна, только NumPy.
+
+    python bench/economy_sim.py --pets 1000000 --hours 24 --output sim.json
+    python bench/economy_sim.py --pets 200000 --xp-percent 150 --event-hours 18-22
+'''
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'pet'))
+
+from actions import ACTIONS, MAX_BATCH_ACTIONS, STAT_MAX, STAT_MIN  # noqa: E402
+from decay import STATS  # noqa: E402
+from leaderboard import BUCKET_WIDTH  # noqa: E402
+
+# Значения по умолчанию из миграций: затухание собаки (V0003), стартовые характеристики
+# и монеты (V0001), квесты (V0004), пороги уровней 50 * (L - 1) * (L + 2) (V0009)
+TICK_SECONDS = 600
+DECAY_PER_TICK = {'hunger': 2, 'happiness': 1, 'health': 0, 'energy': -1}
+START_STATS = {'hunger': 75, 'happiness': 80, 'health': 90, 'energy': 65}
+START_COINS = 100
+QUESTS = (('feed', 3, 50), ('play', 5, 75))
+MAX_LEVEL = 100
+
+# Какое действие игрок выбирает, когда просела характеристика
+REPAIR_ACTION = {'hunger': 'feed', 'happiness': 'play', 'health': 'heal', 'energy': 'rest'}
+
+QUANTILES = (0.1, 0.5, 0.9, 0.99)
+
+
+def level_thresholds(max_level: int = MAX_LEVEL) -> np.ndarray:
+    levels = np.arange(1, max_level + 1, dtype=np.int64)
+    return 50 * (levels - 1) * (levels + 2)
+
+
+def rule_table() -> tuple:
+    '''ACTIONS в виде матриц: изменения характеристик (действие × характеристика) и опыт'''
+    names = list(ACTIONS)
+    deltas = np.zeros((len(names), len(STATS)), dtype=np.int32)
+    xp = np.zeros(len(names), dtype=np.int64)
+    for a, name in enumerate(names):
+        for stat, delta in ACTIONS[name]['stats'].items():
+            deltas[a, STATS.index(stat)] = delta
+        xp[a] = ACTIONS[name]['xp']
+    repair = np.array([names.index(REPAIR_ACTION[stat]) for stat in STATS])
+    return names, deltas, xp, repair
+
+
+def parse_window(value: str) -> tuple:
+    start, end = value.split('-')
+    return float(start), float(end)
+
+
+def diurnal(hour: float, amplitude: float, peak: float) -> float:
+    '''Суточный профиль активности со средним 1 за сутки'''
+    return 1.0 + amplitude * math.cos(2 * math.pi * (hour - peak) / 24)
+
+
+def quantiles(values: np.ndarray) -> dict:
+    if values.size == 0:
+        return {f'p{int(q * 100)}': 0 for q in QUANTILES}
+    points = np.quantile(values, QUANTILES)
+    return {f'p{int(q * 100)}': round(float(p), 2) for q, p in zip(QUANTILES, points)}
+
+
+def simulate(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    names, deltas, action_xp, repair = rule_table()
+    thresholds = level_thresholds()
+    decay = np.array([DECAY_PER_TICK[stat] * args.decay_scale for stat in STATS], dtype=np.int32)[:, None]
+    event_start, event_end = parse_window(args.event_hours)
+    n = args.pets
+
+    stats = np.array([np.full(n, START_STATS[stat], dtype=np.int32) for stat in STATS])
+    xp = np.zeros(n, dtype=np.int64)
+    level = np.ones(n, dtype=np.int64)
+    coins = np.full(n, START_COINS, dtype=np.int64)
+    quest_keys = [names.index(key) for key, _, _ in QUESTS]
+    progress = np.zeros((len(QUESTS), n), dtype=np.int32)
+    done = np.zeros((len(QUESTS), n), dtype=bool)
+    actions_total = np.zeros(n, dtype=np.int64)
+    seen = np.zeros(n, dtype=bool)
+    action_counts = np.zeros(len(names), dtype=np.int64)
+    # Частота сессий игрока: у большинства редкие заходы, у немногих — очень частые
+    sigma = args.activity_spread
+    user_rate = rng.lognormal(math.log(args.sessions_per_hour) - sigma ** 2 / 2, sigma, n)
+
+    steps_per_hour = 3600 / TICK_SECONDS
+    steps = int(args.hours * steps_per_hour)
+    start_supply = int(coins.sum())
+    hourly = []
+    bucket = None
+
+    for step in range(steps):
+        hour = args.start_hour + step / steps_per_hour
+        in_event = event_start <= hour % 24 < event_end
+        xp_percent = args.xp_percent if in_event else 100
+        coin_percent = args.coin_percent if in_event else 100
+
+        stats -= decay
+        np.clip(stats, STAT_MIN, STAT_MAX, out=stats)
+
+        rate = user_rate * diurnal(hour % 24, args.diurnal_amplitude, args.peak_hour) * TICK_SECONDS / 3600
+        sessions = rng.poisson(rate)
+        idx = np.flatnonzero(sessions)
+        sessions = sessions[idx]
+        wanted = np.minimum(sessions + rng.poisson(sessions * (args.actions_per_session - 1)),
+                            sessions * MAX_BATCH_ACTIONS)
+
+        local = stats[:, idx]
+        counts = np.zeros((len(names), idx.size), dtype=np.int64)
+        remaining = wanted.copy()
+        live = np.flatnonzero(remaining)
+        while live.size:
+            # Чинится самая низкая характеристика, часть действий выбирается случайно
+            choice = repair[np.argmin(local[:, live], axis=0)]
+            random_pick = rng.random(live.size) < args.random_action
+            choice[random_pick] = rng.integers(0, len(names), int(random_pick.sum()))
+            local[:, live] = np.clip(local[:, live] + deltas[choice].T, STAT_MIN, STAT_MAX)
+            counts[choice, live] += 1
+            remaining[live] -= 1
+            live = live[remaining[live] > 0]
+        stats[:, idx] = local
+
+        gained = (action_xp[:, None] * xp_percent // 100 * counts).sum(axis=0)
+        old_xp = xp[idx]
+        new_xp = old_xp + gained
+        xp[idx] = new_xp
+        level[idx] = np.maximum(level[idx], np.searchsorted(thresholds, new_xp, side='right'))
+        crossed = int(np.count_nonzero((old_xp // BUCKET_WIDTH != new_xp // BUCKET_WIDTH) & (new_xp > 0)))
+
+        reward = np.zeros(idx.size, dtype=np.int64)
+        quest_rows = 0
+        for q, (_, goal, amount) in enumerate(QUESTS):
+            touched = counts[quest_keys[q]] > 0
+            open_quest = ~done[q, idx]
+            quest_rows += int(np.count_nonzero(touched & open_quest))
+            reached = open_quest & (progress[q, idx] + counts[quest_keys[q]] >= goal)
+            progress[q, idx] = np.minimum(goal, progress[q, idx] + counts[quest_keys[q]])
+            done[q, idx] |= reached
+            reward += reached * (amount * coin_percent // 100)
+        coins[idx] += reward
+
+        actions_total[idx] += wanted
+        action_counts += counts.sum(axis=1)
+        posts = int(np.ceil(wanted / args.batch).sum())
+        gets = int(sessions.sum()) * args.gets_per_session
+
+        if bucket is None or step % steps_per_hour == 0:
+            bucket = {'hour': round(hour, 2), 'active_users': 0, 'actions': 0, 'posts': 0, 'gets': 0,
+                      'write_rows': 0, 'coins_minted': 0, 'peak_step_qps': 0.0, 'seconds': 0}
+            hourly.append(bucket)
+            seen[:] = False
+        seen[idx] = True
+        bucket['seconds'] += TICK_SECONDS
+        bucket['actions'] += int(wanted.sum())
+        bucket['posts'] += posts
+        bucket['gets'] += gets
+        # Пакет пишет питомца и игрока, незакрытые квесты своих ключей и две корзины
+        # рейтинга при переходе границы (см. actions.action_statement)
+        bucket['write_rows'] += 2 * posts + quest_rows + 2 * crossed
+        bucket['coins_minted'] += int(reward.sum())
+        bucket['peak_step_qps'] = max(bucket['peak_step_qps'], (posts + gets) * args.scale / TICK_SECONDS)
+
+        if (step + 1) % steps_per_hour == 0 or step == steps - 1:
+            bucket['active_users'] = int(np.count_nonzero(seen))
+            bucket['coin_supply'] = int(coins.sum())
+            bucket['xp'] = quantiles(xp)
+            bucket['level'] = quantiles(level)
+
+    hours = steps / steps_per_hour
+    for entry in hourly:
+        seconds = entry.pop('seconds')
+        entry['qps'] = round((entry['posts'] + entry['gets']) * args.scale / seconds, 2)
+        entry['post_qps'] = round(entry['posts'] * args.scale / seconds, 2)
+        entry['write_rows_per_sec'] = round(entry['write_rows'] * args.scale / seconds, 2)
+        entry['peak_step_qps'] = round(entry['peak_step_qps'], 2)
+
+    per_hour = actions_total / hours
+    peak = max(hourly, key=lambda entry: entry['qps'])
+    end_supply = int(coins.sum())
+    levels, level_counts = np.unique(level, return_counts=True)
+    return {
+        'hourly': hourly,
+        'xp': quantiles(xp),
+        'level_histogram': {int(lv): int(count) for lv, count in zip(levels, level_counts)},
+        'coins': {
+            'start_supply': start_supply,
+            'end_supply': end_supply,
+            'minted': end_supply - start_supply,
+            'inflation_percent': round(100 * (end_supply - start_supply) / start_supply, 2),
+            'per_user': quantiles(coins)
+        },
+        'actions_per_user_hour': {
+            'mean': round(float(per_hour.mean()), 3),
+            **quantiles(per_hour),
+            'idle_share': round(float(np.mean(actions_total == 0)), 4)
+        },
+        'actions': {name: int(count) for name, count in zip(names, action_counts)},
+        'stats': {
+            stat: {'mean': round(float(stats[s].mean()), 2), 'zero_share': round(float(np.mean(stats[s] == STAT_MIN)), 4)}
+            for s, stat in enumerate(STATS)
+        },
+        'capacity': {
+            'scale': args.scale,
+            'mean_qps': round(sum(entry['qps'] for entry in hourly) / len(hourly), 2),
+            'peak_hour': peak['hour'],
+            'peak_hour_qps': peak['qps'],
+            'peak_step_qps': max(entry['peak_step_qps'] for entry in hourly),
+            'peak_post_qps': max(entry['post_qps'] for entry in hourly),
+            'peak_write_rows_per_sec': max(entry['write_rows_per_sec'] for entry in hourly)
+        }
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pets', type=int, default=1000000)
+    parser.add_argument('--hours', type=float, default=24.0)
+    parser.add_argument('--start-hour', type=float, default=0.0, help='час суток в начале прогона')
+    parser.add_argument('--sessions-per-hour', type=float, default=0.5, help='средняя частота заходов игрока')
+    parser.add_argument('--activity-spread', type=float, default=1.0, help='сигма логнормального разброса частоты')
+    parser.add_argument('--actions-per-session', type=float, default=4.0)
+    parser.add_argument('--random-action', type=float, default=0.2, help='доля действий, выбранных случайно')
+    parser.add_argument('--batch', type=int, default=1, help='действий в одном POST (клиент шлёт по одному)')
+    parser.add_argument('--gets-per-session', type=int, default=1, help='GET /pet на сессию')
+    parser.add_argument('--diurnal-amplitude', type=float, default=0.6)
+    parser.add_argument('--peak-hour', type=float, default=20.0)
+    parser.add_argument('--decay-scale', type=int, default=1, help='множитель скоростей затухания')
+    parser.add_argument('--xp-percent', type=int, default=100, help='множитель опыта события, проценты')
+    parser.add_argument('--coin-percent', type=int, default=100, help='множитель монет события, проценты')
+    parser.add_argument('--event-hours', default='0-24', help='часы суток, когда действуют множители')
+    parser.add_argument('--scale', type=float, default=1.0, help='во сколько раз реальная аудитория больше симулируемой')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='куда записать JSON (по умолчанию stdout)')
+    args = parser.parse_args()
+    if not 1 <= args.batch <= MAX_BATCH_ACTIONS:
+        parser.error(f'--batch должен быть от 1 до {MAX_BATCH_ACTIONS}')
+
+    started = time.perf_counter()
+    report = simulate(args)
+    report = {
+        'config': vars(args),
+        'seconds': round(time.perf_counter() - started, 2),
+        **report
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as target:
+            target.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
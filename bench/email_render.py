@@ -0,0 +1,83 @@
+'''Сравнение сборки писем: str.replace на каждую подстановку против скомпилированных шаблонов
+
+Без базы и сети. Меряет три пути на одном потоке уведомлений, где значения
+повторяются с заданной долей (--repeat): наивную замену (с тем же экранированием
+значений), рендер скомпилированного шаблона и рендер с кэшем одинаковых наборов.
+
+    python bench/email_render.py --renders 100000 --repeat 0.8
+'''
+
+import argparse
+import html
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'extensions', 'unisender-go', 'unisender'))
+
+from templates import COMPILED, TEMPLATES, _render_named, render_compiled, render_template  # noqa: E402
+
+
+def naive_render(name: str, substitutions: dict) -> tuple:
+    template = TEMPLATES[name]
+    subject, body = template['subject'], template['html']
+    for key, value in substitutions.items():
+        subject = subject.replace('{{' + key + '}}', str(value))
+        body = body.replace('{{' + key + '}}', html.escape(str(value)))
+    return subject, body
+
+
+def compiled_render(name: str, substitutions: dict) -> tuple:
+    subject, body = COMPILED[name]
+    return render_compiled(subject, substitutions, escape=False), render_compiled(body, substitutions)
+
+
+def make_stream(count: int, repeat: float, seed: int) -> list:
+    rng = random.Random(seed)
+    hot = [
+        ('quest-complete', {'username': f'player{i}', 'pet_name': 'Дружок', 'quest_name': 'Покорми питомца 3 раза', 'reward': 50})
+        for i in range(50)
+    ]
+    stream = []
+    for index in range(count):
+        if rng.random() < repeat:
+            stream.append(rng.choice(hot))
+        else:
+            stream.append(('item-sold', {'username': f'seller{index}', 'buyer': f'buyer{index}', 'item_name': 'Мячик', 'price': index % 90 + 10}))
+    return stream
+
+
+def measure(fn, stream: list, rounds: int) -> dict:
+    samples = []
+    for _ in range(rounds):
+        _render_named.cache_clear()
+        started = time.perf_counter()
+        for name, substitutions in stream:
+            fn(name, substitutions)
+        samples.append((time.perf_counter() - started) / len(stream) * 1e6)
+    return {'mean_us': round(statistics.fmean(samples), 3), 'best_us': round(min(samples), 3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--renders', type=int, default=50000)
+    parser.add_argument('--repeat', type=float, default=0.8, help='доля писем с уже встречавшимся набором подстановок')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    stream = make_stream(args.renders, args.repeat, 42)
+    report = {
+        'renders': args.renders,
+        'repeat': args.repeat,
+        'naive_replace': measure(naive_render, stream, args.rounds),
+        'compiled': measure(compiled_render, stream, args.rounds),
+        'compiled_cached': measure(render_template, stream, args.rounds)
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+'''Нагрузочный прогон всех обработчиков без HTTP: handler(event, context) напрямую
+
+Засевает локальную базу заданными объёмами, затем на каждом уровне конкурентности
+прогоняет смешанную нагрузку по всем функциям (опрос GET /pet, серии feed/play, просмотр
+рынка, параллельные покупки горячих предложений, вход и регистрация, постановка писем в
+очередь и её разбор) и печатает JSON с пропускной способностью и p50/p95/p99 по каждому
+действию. Вместо Unisender Go в том же процессе поднимается заглушка
+scripts/unisender_stub.py. Результаты разных коммитов сравниваются по этому JSON.
+Зарегистрированные прогоном игроки имеют адреса loadreg-...@bench.local.
+
+    DATABASE_URL=postgresql://localhost/tamagotchi python bench/loadtest.py \\
+        --users 20000 --offers 5000 --concurrency 1,8,32 --duration 15 --output run.json
+'''
+
+import argparse
+import importlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from http.server import ThreadingHTTPServer
+
+import psycopg2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND = os.path.join(ROOT, 'backend')
+FUNCTIONS = {
+    'pet': os.path.join(BACKEND, 'pet'),
+    'trade': os.path.join(BACKEND, 'trade'),
+    'auth': os.path.join(BACKEND, 'auth'),
+    'unisender': os.path.join(BACKEND, 'extensions', 'unisender-go', 'unisender')
+}
+
+BENCH_EMAIL_PATTERN = 'load-%@bench.local'
+BENCH_PASSWORD = 'load-password'
+BENCH_DRAIN_TOKEN = 'load-drain-token'
+
+DEFAULT_MIX = {
+    'pet_get': 40,
+    'pet_get_etag': 20,
+    'pet_actions': 20,
+    'market_browse': 12,
+    'market_buy': 8,
+    'auth_login': 4,
+    'auth_register': 1,
+    'email_send': 4,
+    'email_drain': 1
+}
+
+
+def load_handler(function_dir: str):
+    '''Импортирует index.py функции отдельно от остальных: у всех функций одинаковые имена модулей'''
+    siblings = [name[:-3] for name in os.listdir(function_dir) if name.endswith('.py')]
+    for name in siblings:
+        sys.modules.pop(name, None)
+    sys.path.insert(0, function_dir)
+    try:
+        module = importlib.import_module('index')
+    finally:
+        sys.path.remove(function_dir)
+        for name in siblings:
+            sys.modules.pop(name, None)
+    return module.handler
+
+
+def seed(cur, users: int, items_per_user: int, offers: int) -> None:
+    sys.path.insert(0, os.path.join(BACKEND, 'auth'))
+    try:
+        from provisioning import hash_password, provision_sql
+    finally:
+        sys.path.pop(0)
+        sys.modules.pop('provisioning', None)
+
+    password_hash = hash_password(BENCH_PASSWORD)
+    cur.execute(
+        provision_sql(
+            """
+            INSERT INTO users (email, password_hash, username, coins)
+            SELECT 'load-' || g || '@bench.local', %s, 'load' || g, 1000000
+            FROM generate_series(1, %s) g
+            ON CONFLICT (email) DO NOTHING
+            """,
+            select='COUNT(*)'
+        ),
+        (password_hash, users)
+    )
+    # Игроки из прошлых прогонов засевались без настоящего пароля
+    cur.execute(
+        "UPDATE users SET password_hash = %s WHERE email LIKE %s AND password_hash != %s",
+        (password_hash, BENCH_EMAIL_PATTERN, password_hash)
+    )
+    cur.execute(
+        """
+        INSERT INTO inventory (user_id, item_name, item_type, effect, quantity)
+        SELECT u.id, 'Предмет ' || g, CASE WHEN g %% 2 = 0 THEN 'food' ELSE 'toy' END, 10 + g, 1000
+        FROM users u CROSS JOIN generate_series(1, %s) g
+        WHERE u.email LIKE %s
+        ON CONFLICT (user_id, item_name) DO NOTHING
+        """,
+        (items_per_user, BENCH_EMAIL_PATTERN)
+    )
+    refill_offers(cur, offers)
+
+
+def refill_offers(cur, offers: int) -> None:
+    '''Доводит число активных предложений тестовых продавцов до заданного'''
+    cur.execute(
+        """
+        INSERT INTO trade_offers (seller_id, item_name, item_type, effect, price)
+        SELECT u.id, 'Предмет 1', 'toy', 11, 5 + (random() * 50)::INTEGER
+        FROM (
+            SELECT id FROM users WHERE email LIKE %s ORDER BY random()
+            LIMIT GREATEST(0, %s - (
+                SELECT COUNT(*) FROM trade_offers t JOIN users s ON s.id = t.seller_id
+                WHERE t.status = 'active' AND s.email LIKE %s
+            ))
+        ) u
+        """,
+        (BENCH_EMAIL_PATTERN, offers, BENCH_EMAIL_PATTERN)
+    )
+
+
+def start_unisender_stub() -> ThreadingHTTPServer:
+    '''Заглушка Unisender Go на свободном порту в фоновом потоке'''
+    sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+    try:
+        from unisender_stub import StubHandler
+    finally:
+        sys.path.pop(0)
+
+    class QuietStubHandler(StubHandler):
+        # Строки connection_closed заглушки смешались бы с JSON отчёта в stdout
+        def finish(self):
+            super(StubHandler, self).finish()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), QuietStubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Workload:
+    def __init__(self, handlers: dict, users: list, offer_ids: list, hot_offers: int, batch: int):
+        self.handlers = handlers
+        self.user_ids = [user_id for user_id, _ in users]
+        self.emails = [email for _, email in users]
+        self.hot_offers = offer_ids[:hot_offers]
+        self.batch = batch
+        self.etags = {}
+        self.cursors = {}
+
+    def pet_get(self, rng):
+        user_id = rng.choice(self.user_ids)
+        return self.handlers['pet']({'httpMethod': 'GET', 'queryStringParameters': {'user_id': str(user_id)}}, None)
+
+    def pet_get_etag(self, rng):
+        user_id = rng.choice(self.user_ids)
+        headers = {'If-None-Match': self.etags[user_id]} if user_id in self.etags else {}
+        response = self.handlers['pet'](
+            {'httpMethod': 'GET', 'queryStringParameters': {'user_id': str(user_id)}, 'headers': headers}, None
+        )
+        if response.get('headers', {}).get('ETag'):
+            self.etags[user_id] = response['headers']['ETag']
+        return response
+
+    def pet_actions(self, rng):
+        actions = [rng.choice(('feed', 'play')) for _ in range(self.batch)]
+        body = {'actions': actions, 'user_id': rng.choice(self.user_ids)}
+        return self.handlers['pet']({'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+
+    def market_browse(self, rng):
+        user_id = rng.choice(self.user_ids)
+        params = {'user_id': str(user_id)}
+        if self.cursors.get(user_id):
+            params['cursor'] = self.cursors[user_id]
+        response = self.handlers['trade']({'httpMethod': 'GET', 'queryStringParameters': params}, None)
+        if response.get('statusCode') == 200:
+            self.cursors[user_id] = json.loads(response['body']).get('next_cursor')
+        return response
+
+    def market_buy(self, rng):
+        if not self.hot_offers:
+            return {'statusCode': 0}
+        body = {'action': 'buy', 'user_id': rng.choice(self.user_ids), 'offer_id': rng.choice(self.hot_offers)}
+        return self.handlers['trade']({'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+
+    def auth_login(self, rng):
+        body = {'action': 'login', 'email': rng.choice(self.emails), 'password': BENCH_PASSWORD}
+        return self.handlers['auth']({'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+
+    def auth_register(self, rng):
+        body = {'action': 'register', 'email': f'loadreg-{uuid.uuid4().hex}@bench.local', 'password': BENCH_PASSWORD}
+        return self.handlers['auth']({'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+
+    def email_send(self, rng):
+        body = {
+            'to_email': rng.choice(self.emails),
+            'subject': 'Квест выполнен',
+            'body_html': '<p>{{username}}, награда уже на счету.</p>',
+            'substitutions': {'username': 'load'}
+        }
+        return self.handlers['unisender'](
+            {'httpMethod': 'POST', 'queryStringParameters': {'action': 'send'}, 'body': json.dumps(body)}, None
+        )
+
+    def email_drain(self, rng):
+        return self.handlers['unisender']({
+            'httpMethod': 'POST',
+            'queryStringParameters': {'action': 'drain'},
+            'headers': {'X-Drain-Token': BENCH_DRAIN_TOKEN},
+            'body': json.dumps({'batch_size': 20, 'time_budget': 2})
+        }, None)
+
+
+def percentile(sorted_samples: list, q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def run_level(workload: Workload, mix: dict, concurrency: int, duration: float, seed_value: int) -> dict:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    statuses = {name: {} for name in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index: int) -> None:
+        rng = random.Random(seed_value * 1000 + index)
+        local = {name: [] for name in names}
+        local_status = {name: {} for name in names}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            response = getattr(workload, name)(rng)
+            local[name].append((time.perf_counter() - started) * 1000)
+            code = str(response.get('statusCode'))
+            local_status[name][code] = local_status[name].get(code, 0) + 1
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                for code, count in local_status[name].items():
+                    statuses[name][code] = statuses[name].get(code, 0) + count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    actions = {}
+    for name in names:
+        ordered = sorted(samples[name])
+        actions[name] = {
+            'count': len(ordered),
+            'throughput_rps': round(len(ordered) / elapsed, 2),
+            'mean_ms': round(statistics.fmean(ordered), 3) if ordered else 0.0,
+            'p50_ms': round(percentile(ordered, 0.50), 3),
+            'p95_ms': round(percentile(ordered, 0.95), 3),
+            'p99_ms': round(percentile(ordered, 0.99), 3),
+            'statuses': statuses[name]
+        }
+    total = sum(action['count'] for action in actions.values())
+    return {
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 2),
+        'throughput_rps': round(total / elapsed, 2),
+        'actions': actions
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--items-per-user', type=int, default=5)
+    parser.add_argument('--offers', type=int, default=2000)
+    parser.add_argument('--hot-offers', type=int, default=20, help='сколько предложений делят параллельные покупатели')
+    parser.add_argument('--batch', type=int, default=3, help='действий в одной серии feed/play')
+    parser.add_argument('--concurrency', default='1,8,32', help='уровни через запятую')
+    parser.add_argument('--duration', type=float, default=10.0, help='секунд на уровень')
+    parser.add_argument('--mix', default=json.dumps(DEFAULT_MIX), help='веса действий в JSON')
+    parser.add_argument('--no-seed', action='store_true')
+    parser.add_argument('--output', help='куда записать JSON (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    mix = json.loads(args.mix)
+
+    # Пулы функций читают размер при импорте: даём каждой по соединению на поток
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(max(levels)))
+    stub = start_unisender_stub()
+    os.environ['UNISENDER_GO_API_URL'] = f'http://127.0.0.1:{stub.server_address[1]}'
+    os.environ.setdefault('UNISENDER_API_KEY', 'load')
+    os.environ.setdefault('SESSION_SECRET', 'load-session-secret')
+    os.environ['OUTBOX_DRAIN_TOKEN'] = BENCH_DRAIN_TOKEN
+    handlers = {name: load_handler(path) for name, path in FUNCTIONS.items()}
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    if not args.no_seed:
+        seed(cur, args.users, args.items_per_user, args.offers)
+        conn.commit()
+    cur.execute("SELECT id, email FROM users WHERE email LIKE %s", (BENCH_EMAIL_PATTERN,))
+    users = cur.fetchall()
+    conn.rollback()
+    if not users:
+        sys.exit('Нет тестовых пользователей: запустите без --no-seed')
+
+    report = {
+        'revision': git_revision(),
+        'config': {
+            'users': len(users),
+            'offers': args.offers,
+            'hot_offers': args.hot_offers,
+            'batch': args.batch,
+            'duration': args.duration,
+            'mix': mix
+        },
+        'levels': []
+    }
+    for index, concurrency in enumerate(levels):
+        refill_offers(cur, args.offers)
+        cur.execute(
+            """
+            SELECT t.id FROM trade_offers t JOIN users u ON u.id = t.seller_id
+            WHERE t.status = 'active' AND u.email LIKE %s ORDER BY t.id LIMIT %s
+            """,
+            (BENCH_EMAIL_PATTERN, args.hot_offers)
+        )
+        offer_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        workload = Workload(handlers, users, offer_ids, args.hot_offers, args.batch)
+        # Обработчики пишут строку request_timing на каждый вызов; в отчёт она не нужна
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            report['levels'].append(run_level(workload, mix, concurrency, args.duration, index))
+
+    cur.close()
+    conn.close()
+    stub.shutdown()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as target:
+            target.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
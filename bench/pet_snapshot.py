@@ -0,0 +1,162 @@
+'''Сравнение GET /pet: пять последовательных запросов против одного снимка
+
+Запуск на локальной базе с применёнными миграциями:
+
+    DATABASE_URL=postgresql://localhost/tamagotchi python bench/pet_snapshot.py --users 5000 --iterations 2000
+'''
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'pet'))
+
+from snapshot import SNAPSHOT_SQL  # noqa: E402
+
+BENCH_EMAIL_PATTERN = 'bench-%@bench.local'
+
+
+def seed(cur, users: int, items_per_user: int) -> None:
+    '''Заполняет базу тестовыми игроками set-based запросами'''
+    cur.execute(
+        """
+        INSERT INTO users (email, password_hash, username, coins, xp)
+        SELECT 'bench-' || g || '@bench.local', 'x', 'bench' || g, 100 + g %% 900, g %% 5000
+        FROM generate_series(1, %s) g
+        ON CONFLICT (email) DO NOTHING
+        """,
+        (users,)
+    )
+    cur.execute(
+        """
+        INSERT INTO pets (user_id, name, pet_type)
+        SELECT u.id, 'Дружок', 'dog' FROM users u
+        WHERE u.email LIKE %s AND NOT EXISTS (SELECT 1 FROM pets p WHERE p.user_id = u.id)
+        """,
+        (BENCH_EMAIL_PATTERN,)
+    )
+    cur.execute(
+        """
+        INSERT INTO inventory (user_id, item_name, item_type, effect)
+        SELECT u.id, 'Предмет ' || g, CASE WHEN g %% 2 = 0 THEN 'food' ELSE 'toy' END, 10 + g
+        FROM users u CROSS JOIN generate_series(1, %s) g
+        WHERE u.email LIKE %s AND NOT EXISTS (SELECT 1 FROM inventory i WHERE i.user_id = u.id)
+        """,
+        (items_per_user, BENCH_EMAIL_PATTERN)
+    )
+    cur.execute(
+        """
+        INSERT INTO user_achievements (user_id, achievement_name, completed)
+        SELECT u.id, a.name, a.name = 'Первый друг'
+        FROM users u CROSS JOIN (VALUES ('Первый друг'), ('Заботливый'), ('Богач')) a(name)
+        WHERE u.email LIKE %s
+        ON CONFLICT (user_id, achievement_name) DO NOTHING
+        """,
+        (BENCH_EMAIL_PATTERN,)
+    )
+    cur.execute(
+        """
+        INSERT INTO user_quests (user_id, quest_name, goal, reward)
+        SELECT u.id, q.name, q.goal, q.reward
+        FROM users u CROSS JOIN (VALUES ('Покорми питомца 3 раза', 3, 50), ('Поиграй 5 раз', 5, 75)) q(name, goal, reward)
+        WHERE u.email LIKE %s AND NOT EXISTS (SELECT 1 FROM user_quests x WHERE x.user_id = u.id)
+        """,
+        (BENCH_EMAIL_PATTERN,)
+    )
+
+
+def legacy_snapshot(cur, user_id) -> str:
+    '''Прежний путь обработчика: пять запросов и сборка JSON в Python'''
+    cur.execute(
+        "SELECT id, name, pet_type, level, xp, hunger, happiness, health, energy FROM pets WHERE user_id = %s",
+        (user_id,)
+    )
+    pet = cur.fetchone()
+    cur.execute("SELECT level, coins, xp FROM users WHERE id = %s", (user_id,))
+    user = cur.fetchone()
+    cur.execute("SELECT item_name, item_type, effect, quantity FROM inventory WHERE user_id = %s", (user_id,))
+    inventory = cur.fetchall()
+    cur.execute("SELECT achievement_name, completed FROM user_achievements WHERE user_id = %s", (user_id,))
+    achievements = cur.fetchall()
+    cur.execute("SELECT quest_name, progress, goal, reward, completed FROM user_quests WHERE user_id = %s", (user_id,))
+    quests = cur.fetchall()
+    return json.dumps({
+        'pet': {
+            'id': pet[0], 'name': pet[1], 'type': pet[2], 'level': pet[3], 'xp': pet[4],
+            'hunger': pet[5], 'happiness': pet[6], 'health': pet[7], 'energy': pet[8]
+        },
+        'user': {'level': user[0], 'coins': user[1], 'xp': user[2]},
+        'inventory': [{'name': i[0], 'type': i[1], 'effect': i[2], 'quantity': i[3]} for i in inventory],
+        'achievements': [{'name': a[0], 'completed': a[1]} for a in achievements],
+        'quests': [{'name': q[0], 'progress': q[1], 'goal': q[2], 'reward': q[3], 'completed': q[4]} for q in quests]
+    })
+
+
+def single_snapshot(cur, user_id) -> str:
+    cur.execute(SNAPSHOT_SQL, (user_id,))
+    return cur.fetchone()[0]
+
+
+def measure(cur, fn, user_ids: list) -> dict:
+    samples = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        fn(cur, user_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    cur.connection.rollback()
+    quantiles = statistics.quantiles(samples, n=100)
+    return {
+        'iterations': len(samples),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': round(quantiles[49], 3),
+        'p95_ms': round(quantiles[94], 3),
+        'p99_ms': round(quantiles[98], 3)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--items-per-user', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--no-seed', action='store_true')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    if not args.no_seed:
+        seed(cur, args.users, args.items_per_user)
+        conn.commit()
+
+    cur.execute("SELECT id FROM users WHERE email LIKE %s", (BENCH_EMAIL_PATTERN,))
+    ids = [r[0] for r in cur.fetchall()]
+    conn.rollback()
+    if not ids:
+        sys.exit('Нет тестовых пользователей: запустите без --no-seed')
+
+    rng = random.Random(42)
+    user_ids = [rng.choice(ids) for _ in range(args.iterations)]
+
+    # Прогрев кэшей Postgres, чтобы первый замер не проигрывал из-за холодных страниц
+    measure(cur, single_snapshot, user_ids[:50])
+
+    report = {
+        'users': len(ids),
+        'legacy_five_queries': measure(cur, legacy_snapshot, user_ids),
+        'single_statement': measure(cur, single_snapshot, user_ids)
+    }
+    print(json.dumps(report, indent=2))
+
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+-- Версия состояния игрока: увеличивается при каждом изменении питомца, инвентаря, монет или квестов
+ALTER TABLE users ADD COLUMN IF NOT EXISTS state_version BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,42 @@
+-- Скорости затухания характеристик по типу питомца: сколько пунктов теряется за один тик.
+-- Отрицательное значение означает восстановление (например, энергия во время простоя).
+CREATE TABLE IF NOT EXISTS pet_decay_rates (
+    pet_type VARCHAR(50) PRIMARY KEY,
+    tick_seconds INTEGER NOT NULL DEFAULT 600 CHECK (tick_seconds > 0),
+    hunger_per_tick INTEGER NOT NULL DEFAULT 0,
+    happiness_per_tick INTEGER NOT NULL DEFAULT 0,
+    health_per_tick INTEGER NOT NULL DEFAULT 0,
+    energy_per_tick INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO pet_decay_rates (pet_type, tick_seconds, hunger_per_tick, happiness_per_tick, health_per_tick, energy_per_tick)
+VALUES ('dog', 600, 2, 1, 0, -1)
+ON CONFLICT (pet_type) DO NOTHING;
+
+-- Момент, на который сохранённые характеристики актуальны
+ALTER TABLE pets ADD COLUMN IF NOT EXISTS stats_updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Характеристики с учётом прошедшего времени. Затухание считается целыми тиками,
+-- а stats_updated_at сдвигается ровно на учтённые тики, поэтому остаток не теряется
+-- при частых записях.
+CREATE OR REPLACE VIEW pets_decayed AS
+SELECT
+    p.id,
+    p.user_id,
+    p.name,
+    p.pet_type,
+    p.level,
+    p.xp,
+    LEAST(100, GREATEST(0, p.hunger - t.ticks * COALESCE(r.hunger_per_tick, 0))) AS hunger,
+    LEAST(100, GREATEST(0, p.happiness - t.ticks * COALESCE(r.happiness_per_tick, 0))) AS happiness,
+    LEAST(100, GREATEST(0, p.health - t.ticks * COALESCE(r.health_per_tick, 0))) AS health,
+    LEAST(100, GREATEST(0, p.energy - t.ticks * COALESCE(r.energy_per_tick, 0))) AS energy,
+    p.stats_updated_at + t.ticks * COALESCE(r.tick_seconds, 600) * INTERVAL '1 second' AS stats_updated_at,
+    t.ticks
+FROM pets p
+LEFT JOIN pet_decay_rates r ON r.pet_type = p.pet_type
+CROSS JOIN LATERAL (
+    SELECT GREATEST(0, FLOOR(
+        EXTRACT(EPOCH FROM (LOCALTIMESTAMP - p.stats_updated_at)) / COALESCE(r.tick_seconds, 600)
+    ))::INTEGER AS ticks
+) t;
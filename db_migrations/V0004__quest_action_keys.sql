@@ -0,0 +1,37 @@
+-- Реестр квестов: каждый квест привязан к ключу действия, прогресс которого он считает
+CREATE TABLE IF NOT EXISTS quest_definitions (
+    id SERIAL PRIMARY KEY,
+    action_key VARCHAR(50) NOT NULL,
+    quest_name VARCHAR(200) UNIQUE NOT NULL,
+    goal INTEGER NOT NULL,
+    reward INTEGER NOT NULL,
+    active BOOLEAN DEFAULT TRUE
+);
+
+INSERT INTO quest_definitions (action_key, quest_name, goal, reward) VALUES
+    ('feed', 'Покорми питомца 3 раза', 3, 50),
+    ('play', 'Поиграй 5 раз', 5, 75)
+ON CONFLICT (quest_name) DO NOTHING;
+
+ALTER TABLE user_quests ADD COLUMN IF NOT EXISTS quest_id INTEGER REFERENCES quest_definitions(id);
+ALTER TABLE user_quests ADD COLUMN IF NOT EXISTS action_key VARCHAR(50);
+ALTER TABLE user_quests ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP;
+
+UPDATE user_quests q
+SET quest_id = d.id, action_key = d.action_key
+FROM quest_definitions d
+WHERE d.quest_name = q.quest_name AND q.action_key IS NULL;
+
+-- Квесты, дошедшие до цели до появления выдачи наград, закрываются с начислением монет
+WITH finished AS (
+    UPDATE user_quests
+    SET completed = TRUE, completed_at = CURRENT_TIMESTAMP
+    WHERE completed = FALSE AND progress >= goal
+    RETURNING user_id, reward
+)
+UPDATE users u
+SET coins = u.coins + f.total, state_version = u.state_version + 1
+FROM (SELECT user_id, SUM(reward) AS total FROM finished GROUP BY user_id) f
+WHERE u.id = f.user_id;
+
+CREATE INDEX IF NOT EXISTS idx_user_quests_user_action ON user_quests(user_id, action_key);
@@ -0,0 +1,7 @@
+-- Частичные индексы по активным предложениям под курсорную пагинацию ленты
+CREATE INDEX IF NOT EXISTS idx_trade_offers_active_created
+    ON trade_offers(created_at DESC, id DESC) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_trade_offers_active_type
+    ON trade_offers(item_type, created_at DESC, id DESC) WHERE status = 'active';
+CREATE INDEX IF NOT EXISTS idx_trade_offers_active_name
+    ON trade_offers(item_name, created_at DESC, id DESC) WHERE status = 'active';
@@ -0,0 +1,21 @@
+-- Одна строка инвентаря на пару (user_id, item_name): количество хранится в quantity.
+-- На больших таблицах сначала запустите scripts/compact_inventory.py, тогда слияние
+-- ниже ничего не найдёт и не будет держать блокировку.
+WITH dups AS (
+    SELECT user_id, item_name, MIN(id) AS keep_id, SUM(quantity) AS total
+    FROM inventory
+    GROUP BY user_id, item_name
+    HAVING COUNT(*) > 1
+), merged AS (
+    UPDATE inventory i SET quantity = d.total
+    FROM dups d
+    WHERE i.id = d.keep_id
+)
+DELETE FROM inventory i
+USING dups d
+WHERE i.user_id = d.user_id AND i.item_name = d.item_name AND i.id != d.keep_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_inventory_user_item ON inventory(user_id, item_name);
+
+-- Уникальный индекс начинается с user_id и заменяет прежний
+DROP INDEX IF EXISTS idx_inventory_user_id;
@@ -0,0 +1,14 @@
+-- Рейтинг по опыту питомца. Число питомцев в каждой корзине по 100 XP поддерживается
+-- инкрементально при каждом действии, поэтому место игрока считается как сумма корзин
+-- выше его собственной плюс короткий диапазон индекса внутри корзины.
+CREATE INDEX IF NOT EXISTS idx_pets_xp ON pets(xp);
+
+CREATE TABLE IF NOT EXISTS leaderboard_buckets (
+    bucket INTEGER PRIMARY KEY,
+    players INTEGER NOT NULL DEFAULT 0
+);
+
+-- Питомцы с нулевым опытом делят последнее место и в корзины не входят
+INSERT INTO leaderboard_buckets (bucket, players)
+SELECT xp / 100, COUNT(*) FROM pets WHERE xp > 0 GROUP BY xp / 100
+ON CONFLICT (bucket) DO UPDATE SET players = EXCLUDED.players;
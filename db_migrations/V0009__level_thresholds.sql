@@ -0,0 +1,12 @@
+-- Таблица порогов уровней: суммарный опыт, с которого начинается уровень.
+-- Переход с уровня L на L + 1 стоит 100 * (L + 1) опыта, поэтому порог уровня L
+-- равен 50 * (L - 1) * (L + 2). Уровень по опыту находится одним обратным
+-- проходом по уникальному индексу xp_required.
+CREATE TABLE IF NOT EXISTS level_thresholds (
+    level INTEGER PRIMARY KEY,
+    xp_required INTEGER NOT NULL UNIQUE
+);
+
+INSERT INTO level_thresholds (level, xp_required)
+SELECT g, 50 * (g - 1) * (g + 2) FROM generate_series(1, 100) g
+ON CONFLICT (level) DO NOTHING;
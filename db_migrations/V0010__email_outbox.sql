@@ -0,0 +1,19 @@
+-- Очередь исходящих писем: отправка из обработчика только ставит письмо в очередь,
+-- а отправляют его обработчики очереди (action=drain или scripts/drain_outbox.py).
+-- status: pending — ждёт отправки, sending — взято обработчиком до next_attempt_at,
+-- sent — принято Unisender, dead — исчерпаны попытки.
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    message JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    job_id VARCHAR(100),
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Обработчики выбирают только письма, которые пора отправить
+CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(next_attempt_at)
+    WHERE status IN ('pending', 'sending');
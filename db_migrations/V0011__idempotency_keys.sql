@@ -0,0 +1,17 @@
+-- Ключи идемпотентности для POST в pet и trade: повтор запроса с тем же
+-- Idempotency-Key получает сохранённый ответ вместо повторного действия.
+-- Строка пишется в той же транзакции, что и само действие, поэтому при откате
+-- ключ не остаётся занятым. Просроченные ключи переиспользуются при следующей
+-- вставке и удаляются scripts/purge_idempotency_keys.py.
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INTEGER NOT NULL,
+    scope VARCHAR(20) NOT NULL,
+    idem_key VARCHAR(100) NOT NULL,
+    request_hash CHAR(32) NOT NULL,
+    status_code SMALLINT,
+    body TEXT,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, scope, idem_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at);
@@ -0,0 +1,37 @@
+-- Сводка цен по предмету, которую покупка и выставление обновляют инкрементально:
+-- последняя цена сделки, скользящее (экспоненциальное) среднее, число продаж и оборот,
+-- число активных предложений и минимальная цена среди них.
+CREATE TABLE IF NOT EXISTS item_price_stats (
+    item_name VARCHAR(100) PRIMARY KEY,
+    last_price INTEGER,
+    avg_price NUMERIC(12, 2),
+    sales INTEGER NOT NULL DEFAULT 0,
+    volume BIGINT NOT NULL DEFAULT 0,
+    active_offers INTEGER NOT NULL DEFAULT 0,
+    floor_price INTEGER,
+    last_sale_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Пересчёт минимальной цены, когда куплено самое дешёвое предложение
+CREATE INDEX IF NOT EXISTS idx_trade_offers_active_price
+    ON trade_offers(item_name, price) WHERE status = 'active';
+
+-- История сделок по предмету для scripts/rebuild_price_stats.py
+CREATE INDEX IF NOT EXISTS idx_trade_offers_completed_item
+    ON trade_offers(item_name, completed_at, id) WHERE status = 'completed';
+
+-- Начальное заполнение; среднее здесь простое, точное скользящее среднее
+-- досчитывает scripts/rebuild_price_stats.py
+INSERT INTO item_price_stats (item_name, last_price, avg_price, sales, volume, active_offers, floor_price, last_sale_at)
+SELECT item_name,
+       (ARRAY_AGG(price ORDER BY completed_at DESC, id DESC) FILTER (WHERE status = 'completed'))[1],
+       ROUND(AVG(price) FILTER (WHERE status = 'completed'), 2),
+       COUNT(*) FILTER (WHERE status = 'completed'),
+       COALESCE(SUM(price) FILTER (WHERE status = 'completed'), 0),
+       COUNT(*) FILTER (WHERE status = 'active'),
+       MIN(price) FILTER (WHERE status = 'active'),
+       MAX(completed_at) FILTER (WHERE status = 'completed')
+FROM trade_offers
+GROUP BY item_name
+ON CONFLICT (item_name) DO NOTHING;
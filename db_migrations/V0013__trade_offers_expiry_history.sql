@@ -0,0 +1,38 @@
+-- Срок жизни предложения: по истечении scripts/archive_offers.py переводит его в
+-- статус expired и возвращает предмет продавцу. Уже выставленные получают срок от
+-- момента создания.
+ALTER TABLE trade_offers ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP;
+
+UPDATE trade_offers SET expires_at = created_at + INTERVAL '72 hours'
+WHERE status = 'active' AND expires_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_trade_offers_active_expiry
+    ON trade_offers(expires_at) WHERE status = 'active';
+
+-- Закрытые (completed, expired) предложения по времени закрытия — очередь архивации
+CREATE INDEX IF NOT EXISTS idx_trade_offers_closed
+    ON trade_offers(completed_at, id) WHERE status != 'active';
+
+-- Архив закрытых предложений; в горячей таблице остаются активные и недавно закрытые
+CREATE TABLE IF NOT EXISTS trade_offers_history (
+    id INTEGER PRIMARY KEY,
+    seller_id INTEGER,
+    buyer_id INTEGER,
+    item_name VARCHAR(100) NOT NULL,
+    item_type VARCHAR(50) NOT NULL,
+    effect INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP,
+    completed_at TIMESTAMP,
+    expires_at TIMESTAMP,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_trade_offers_history_seller ON trade_offers_history(seller_id, completed_at);
+CREATE INDEX IF NOT EXISTS idx_trade_offers_history_sales
+    ON trade_offers_history(item_name, completed_at, id) WHERE status = 'completed';
+
+-- Горячая таблица постоянно обновляется и чистится порциями: автоочистка должна
+-- приходить раньше, чем мёртвые версии строк раздуют частичные индексы
+ALTER TABLE trade_offers SET (autovacuum_vacuum_scale_factor = 0.02, autovacuum_analyze_scale_factor = 0.02);
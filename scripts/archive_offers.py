@@ -0,0 +1,71 @@
+'''Снятие истёкших предложений и архивация закрытых порциями
+
+Сначала закрывает предложения с истёкшим сроком (предмет возвращается продавцу),
+затем переносит completed и expired старше --keep-hours в trade_offers_history.
+Каждая порция — отдельная короткая транзакция; строки, которые прямо сейчас покупают,
+пропускаются и попадут в следующий запуск. Запускается по расписанию, например раз в
+несколько минут.
+
+    DATABASE_URL=... python scripts/archive_offers.py --chunk 1000 --keep-hours 24
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg2
+import psycopg2.errors
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'trade'))
+
+from archive import archive_chunk, expire_chunk  # noqa: E402
+
+
+def run_chunks(conn, chunk, limit: int, pause: float, **params) -> tuple:
+    '''Гоняет порции, пока очередная не окажется неполной; возвращает суммы по столбцам'''
+    cur = conn.cursor()
+    totals = None
+    while True:
+        try:
+            row = chunk(cur, limit, **params)
+            conn.commit()
+        except psycopg2.errors.DeadlockDetected:
+            # Продавец порции одновременно покупает; порция повторится целиком
+            conn.rollback()
+            continue
+        totals = row if totals is None else tuple(a + b for a, b in zip(totals, row))
+        if row[0] < limit:
+            break
+        if pause:
+            time.sleep(pause)
+    cur.close()
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunk', type=int, default=1000, help='предложений на одну транзакцию')
+    parser.add_argument('--keep-hours', type=float, default=24.0, help='сколько закрытые остаются в горячей таблице')
+    parser.add_argument('--pause', type=float, default=0.0, help='пауза между порциями, секунды')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+
+    started = time.perf_counter()
+    expired, sellers = run_chunks(conn, expire_chunk, args.chunk, args.pause)
+    archived, replaced = run_chunks(conn, archive_chunk, args.chunk, args.pause, keep=args.keep_hours * 3600)
+
+    print(json.dumps({
+        'expired': expired,
+        'sellers': sellers,
+        'archived': archived,
+        'replaced': replaced,
+        'seconds': round(time.perf_counter() - started, 2)
+    }))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
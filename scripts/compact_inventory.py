@@ -0,0 +1,75 @@
+'''Слияние дублирующихся строк инвентаря порциями
+
+Для каждого диапазона user_id блокирует только строки-дубликаты, суммирует их количество
+в строку с минимальным id и удаляет остальные. Каждая порция — отдельная короткая
+транзакция, поэтому покупки и продажи не ждут конца всего прохода.
+
+    DATABASE_URL=... python scripts/compact_inventory.py --chunk 5000
+'''
+
+import argparse
+import json
+import os
+import time
+
+import psycopg2
+
+COMPACT_CHUNK_SQL = """
+    WITH locked AS (
+        SELECT id, user_id, item_name, quantity
+        FROM inventory
+        WHERE user_id >= %(low)s AND user_id < %(high)s
+          AND (user_id, item_name) IN (
+              SELECT user_id, item_name FROM inventory
+              WHERE user_id >= %(low)s AND user_id < %(high)s
+              GROUP BY user_id, item_name
+              HAVING COUNT(*) > 1
+          )
+        FOR UPDATE
+    ), dups AS (
+        SELECT user_id, item_name, MIN(id) AS keep_id, SUM(quantity) AS total
+        FROM locked
+        GROUP BY user_id, item_name
+    ), merged AS (
+        UPDATE inventory i SET quantity = d.total
+        FROM dups d
+        WHERE i.id = d.keep_id
+    )
+    DELETE FROM inventory i
+    USING locked l, dups d
+    WHERE i.id = l.id AND l.user_id = d.user_id AND l.item_name = d.item_name AND l.id != d.keep_id
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunk', type=int, default=5000, help='размер диапазона user_id на одну транзакцию')
+    parser.add_argument('--pause', type=float, default=0.0, help='пауза между порциями, секунды')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(MIN(user_id), 0), COALESCE(MAX(user_id), -1) FROM inventory")
+    low, high = cur.fetchone()
+    conn.commit()
+
+    started = time.perf_counter()
+    removed = 0
+    for chunk_start in range(low, high + 1, args.chunk):
+        cur.execute(COMPACT_CHUNK_SQL, {'low': chunk_start, 'high': chunk_start + args.chunk})
+        removed += cur.rowcount
+        conn.commit()
+        if args.pause:
+            time.sleep(args.pause)
+
+    print(json.dumps({
+        'removed_rows': removed,
+        'user_id_range': [low, high],
+        'seconds': round(time.perf_counter() - started, 2)
+    }))
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''Постоянный обработчик очереди писем email_outbox
+
+Запускает несколько потоков, каждый из которых забирает порции писем через
+FOR UPDATE SKIP LOCKED и отправляет их через Unisender Go. Процессов тоже можно
+запустить сколько угодно: одно письмо достаётся только одному обработчику.
+С --once выходит, когда очередь опустела.
+
+    DATABASE_URL=... UNISENDER_API_KEY=... python scripts/drain_outbox.py --workers 4
+'''
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+UNISENDER = os.path.join(os.path.dirname(__file__), '..', 'backend', 'extensions', 'unisender-go', 'unisender')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2, help='параллельных обработчиков в процессе')
+    parser.add_argument('--batch', type=int, default=20, help='писем на одну выборку')
+    parser.add_argument('--interval', type=float, default=5.0, help='пауза при пустой очереди, секунды')
+    parser.add_argument('--once', action='store_true', help='выйти, когда очередь опустеет')
+    args = parser.parse_args()
+
+    # Пул читает размер при импорте: по соединению на поток
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.workers))
+    sys.path.insert(0, UNISENDER)
+    from index import post_message
+    from outbox import drain
+
+    totals = {'claimed': 0, 'sent': 0, 'retry': 0, 'dead': 0, 'released': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker() -> None:
+        while not stop.is_set():
+            stats = drain(post_message, batch_size=args.batch, time_budget=args.interval)
+            with lock:
+                for key, value in stats.items():
+                    totals[key] = totals.get(key, 0) + value
+            if not stats['claimed']:
+                if args.once:
+                    return
+                stop.wait(args.interval)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1.0)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    print(json.dumps({**totals, 'seconds': round(time.perf_counter() - started, 2)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''Массовый импорт игроков из CSV или JSONL через COPY
+
+Каждая порция строк копируется во временную таблицу одним COPY, после чего один запрос
+создаёт пользователей, питомцев, достижения и квесты тем же шаблоном, что и регистрация.
+Уже существующие email пропускаются.
+
+Формат входа: поля email, username (необязательно) и password или password_hash.
+
+    DATABASE_URL=... python scripts/import_users.py partners.csv --batch 20000
+    DATABASE_URL=... python scripts/import_users.py partners.jsonl
+'''
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'auth'))
+
+from provisioning import hash_password, provision_sql  # noqa: E402
+
+IMPORT_SQL = provision_sql(
+    """
+    INSERT INTO users (email, password_hash, username)
+    SELECT DISTINCT ON (email) email, password_hash, username
+    FROM import_users
+    ORDER BY email
+    ON CONFLICT (email) DO NOTHING
+    """,
+    select='COUNT(*)'
+)
+
+
+def read_records(path: str):
+    with open(path, encoding='utf-8', newline='') as source:
+        if path.endswith('.jsonl'):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(source)
+
+
+def to_row(record: dict) -> tuple:
+    email = (record.get('email') or '').strip()
+    if '@' not in email:
+        return None
+    password_hash = record.get('password_hash') or (hash_password(record['password']) if record.get('password') else None)
+    if not password_hash:
+        return None
+    username = (record.get('username') or '').strip() or email.split('@')[0]
+    return email, password_hash, username[:100]
+
+
+def import_batch(cur, rows: list) -> int:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS import_users "
+        "(email VARCHAR(255), password_hash VARCHAR(255), username VARCHAR(100)) ON COMMIT DELETE ROWS"
+    )
+    cur.copy_expert("COPY import_users (email, password_hash, username) FROM STDIN WITH (FORMAT csv)", buffer)
+    cur.execute(IMPORT_SQL)
+    return cur.fetchone()[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='файл .csv или .jsonl')
+    parser.add_argument('--batch', type=int, default=10000, help='строк на одну транзакцию')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    started = time.perf_counter()
+    stats = {'read': 0, 'skipped_invalid': 0, 'created': 0}
+    rows = []
+    for record in read_records(args.path):
+        stats['read'] += 1
+        row = to_row(record)
+        if row is None:
+            stats['skipped_invalid'] += 1
+            continue
+        rows.append(row)
+        if len(rows) >= args.batch:
+            stats['created'] += import_batch(cur, rows)
+            conn.commit()
+            rows = []
+    if rows:
+        stats['created'] += import_batch(cur, rows)
+        conn.commit()
+
+    stats['skipped_existing'] = stats['read'] - stats['skipped_invalid'] - stats['created']
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    print(json.dumps(stats))
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
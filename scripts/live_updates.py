@@ -0,0 +1,114 @@
+'''Раздача уведомлений NOTIFY подписчикам из одного соединения LISTEN на процесс
+
+Соединение psycopg2 в режиме autocommit слушает канал и подключено к циклу событий
+через add_reader: уведомление раскладывается по очередям подписчиков по полю u без
+отдельных потоков и опроса. Очередь подписчика ограничена, при переполнении
+выбрасываются самые старые сообщения: клиенту важнее последнее состояние. При обрыве
+соединение восстанавливается с нарастающей паузой.
+'''
+
+import asyncio
+import json
+import os
+
+import psycopg2
+import psycopg2.extensions
+
+QUEUE_SIZE = 100
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 30.0
+
+
+class NotificationHub:
+    def __init__(self, channel: str, dsn: str = None):
+        self.channel = channel
+        self.dsn = dsn
+        self.subscribers = {}
+        self.conn = None
+        self.delivered = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self._lost = asyncio.Event()
+        self._stopping = False
+
+    def subscribe(self, user_id) -> asyncio.Queue:
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.subscribers.setdefault(str(user_id), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(str(user_id))
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[str(user_id)]
+
+    def stats(self) -> dict:
+        return {
+            'listening': self.conn is not None,
+            'users': len(self.subscribers),
+            'subscribers': sum(len(queues) for queues in self.subscribers.values()),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'reconnects': self.reconnects
+        }
+
+    async def run(self) -> None:
+        '''Держит соединение LISTEN, пока не вызван stop'''
+        loop = asyncio.get_running_loop()
+        delay = RECONNECT_MIN
+        while not self._stopping:
+            try:
+                self.conn = await loop.run_in_executor(None, self._connect)
+            except psycopg2.Error as e:
+                print(json.dumps({'event': 'listen_failed', 'error': str(e).strip(), 'retry_in': delay}), flush=True)
+                await asyncio.sleep(delay)
+                delay = min(RECONNECT_MAX, delay * 2)
+                continue
+            delay = RECONNECT_MIN
+            self._lost.clear()
+            loop.add_reader(self.conn.fileno(), self._on_readable)
+            await self._lost.wait()
+            loop.remove_reader(self.conn.fileno())
+            self._close()
+            if not self._stopping:
+                self.reconnects += 1
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._lost.set()
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn or os.environ['DATABASE_URL'])
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN {self.channel}')
+        return conn
+
+    def _on_readable(self) -> None:
+        try:
+            self.conn.poll()
+        except psycopg2.Error:
+            self._lost.set()
+            return
+        while self.conn.notifies:
+            self._dispatch(self.conn.notifies.pop(0).payload)
+
+    def _dispatch(self, payload: str) -> None:
+        try:
+            user_id = str(json.loads(payload).get('u'))
+        except (ValueError, AttributeError):
+            return
+        for queue in self.subscribers.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(payload)
+            self.delivered += 1
+
+    def _close(self) -> None:
+        try:
+            self.conn.close()
+        except psycopg2.Error:
+            pass
+        self.conn = None
@@ -0,0 +1,54 @@
+'''Пакетная материализация затухания характеристик всех питомцев
+
+Идёт по диапазонам id и в каждом обновляет только питомцев, у которых накопился
+хотя бы один тик. Каждая порция — отдельная короткая транзакция, поэтому
+обработчики не ждут блокировок дольше одной порции.
+
+    DATABASE_URL=... python scripts/materialize_decay.py --chunk 10000
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'pet'))
+
+from decay import MATERIALIZE_CHUNK_SQL  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunk', type=int, default=10000, help='размер диапазона id на одну транзакцию')
+    parser.add_argument('--pause', type=float, default=0.0, help='пауза между порциями, секунды')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM pets")
+    low, high = cur.fetchone()
+    conn.commit()
+
+    started = time.perf_counter()
+    updated = 0
+    for chunk_start in range(low, high + 1, args.chunk):
+        cur.execute(MATERIALIZE_CHUNK_SQL, (chunk_start, chunk_start + args.chunk))
+        updated += cur.rowcount
+        conn.commit()
+        if args.pause:
+            time.sleep(args.pause)
+
+    print(json.dumps({
+        'updated': updated,
+        'id_range': [low, high],
+        'seconds': round(time.perf_counter() - started, 2)
+    }))
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+'''Удаление просроченных ключей идемпотентности порциями
+
+Каждая порция — отдельная короткая транзакция по индексу expires_at, поэтому
+обработчики pet и trade не ждут блокировок.
+
+    DATABASE_URL=... python scripts/purge_idempotency_keys.py --chunk 5000
+'''
+
+import argparse
+import json
+import os
+import time
+
+import psycopg2
+
+PURGE_CHUNK_SQL = """
+    DELETE FROM idempotency_keys
+    WHERE ctid IN (
+        SELECT ctid FROM idempotency_keys
+        WHERE expires_at < LOCALTIMESTAMP
+        LIMIT %s
+    )
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunk', type=int, default=5000, help='ключей на одну транзакцию')
+    parser.add_argument('--pause', type=float, default=0.0, help='пауза между порциями, секунды')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    started = time.perf_counter()
+    deleted = 0
+    while True:
+        cur.execute(PURGE_CHUNK_SQL, (args.chunk,))
+        deleted += cur.rowcount
+        conn.commit()
+        if cur.rowcount < args.chunk:
+            break
+        if args.pause:
+            time.sleep(args.pause)
+
+    print(json.dumps({'deleted': deleted, 'seconds': round(time.perf_counter() - started, 2)}))
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+'''Перестроение сводки цен item_price_stats из истории сделок
+
+Обработчик trade сдвигает сводку инкрементально при каждой покупке и выставлении;
+скрипт пересчитывает её с нуля порциями предметов (по возрастанию item_name) по горячей
+таблице и архиву trade_offers_history: скользящее среднее по всем продажам в порядке
+completed_at той же формулой, число и оборот продаж, активные предложения и минимальную
+цену. Строки сводки порции блокируются на время пересчёта, записываются только
+разошедшиеся.
+
+    DATABASE_URL=... python scripts/rebuild_price_stats.py --batch 200
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+from itertools import groupby
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'trade'))
+
+from pricing import (  # noqa: E402
+    REBUILD_ACTIVE_SQL, REBUILD_LOCK_SQL, REBUILD_NAMES_SQL, REBUILD_SALES_SQL, REBUILD_UPSERT_SQL, ewma
+)
+
+
+def rebuild_batch(conn, names: list) -> int:
+    cur = conn.cursor()
+    cur.execute(REBUILD_LOCK_SQL, (names,))
+    cur.execute(REBUILD_ACTIVE_SQL, (names,))
+    active = {name: (count, floor) for name, count, floor in cur.fetchall()}
+
+    sales = {}
+    with conn.cursor(name='price_history') as history:
+        history.itersize = 10000
+        history.execute(REBUILD_SALES_SQL, {'names': names})
+        for name, rows in groupby(history, key=lambda row: row[0]):
+            rows = list(rows)
+            prices = [row[1] for row in rows]
+            sales[name] = (prices[-1], ewma(prices), len(prices), sum(prices), rows[-1][2])
+
+    columns = [[] for _ in range(8)]
+    for name in names:
+        last_price, avg_price, count, volume, last_sale_at = sales.get(name, (None, None, 0, 0, None))
+        active_offers, floor_price = active.get(name, (0, None))
+        row = (name, last_price, avg_price, count, volume, active_offers, floor_price, last_sale_at)
+        for column, value in zip(columns, row):
+            column.append(value)
+    cur.execute(REBUILD_UPSERT_SQL, columns)
+    changed = cur.rowcount
+    cur.close()
+    return changed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch', type=int, default=200, help='предметов на одну транзакцию')
+    parser.add_argument('--pause', type=float, default=0.0, help='пауза между порциями, секунды')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    started = time.perf_counter()
+    items = 0
+    changed = 0
+    after = ''
+    while True:
+        cur.execute(REBUILD_NAMES_SQL, {'after': after, 'limit': args.batch})
+        names = [row[0] for row in cur.fetchall()]
+        if not names:
+            conn.commit()
+            break
+        changed += rebuild_batch(conn, names)
+        conn.commit()
+        items += len(names)
+        after = names[-1]
+        if args.pause:
+            time.sleep(args.pause)
+
+    print(json.dumps({
+        'items': items,
+        'changed': changed,
+        'seconds': round(time.perf_counter() - started, 2)
+    }))
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''Пересчёт уровней питомцев и игроков по таблице порогов level_thresholds
+
+Идёт по диапазонам id и одним запросом на порцию поднимает уровень до положенного по
+накопленному опыту, трогая только строки, где он ниже, и увеличивая state_version их
+владельцев. Уровни не понижаются: после ужесточения порогов набранные уровни остаются.
+Каждая порция — отдельная короткая транзакция. Нужен один раз после миграции V0009 и
+после смягчения порогов.
+
+    DATABASE_URL=... python scripts/recompute_levels.py --chunk 10000
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'pet'))
+
+from levels import RECOMPUTE_CHUNK_SQL  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunk', type=int, default=10000, help='размер диапазона id на одну транзакцию')
+    parser.add_argument('--pause', type=float, default=0.0, help='пауза между порциями, секунды')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    started = time.perf_counter()
+    report = {}
+    for table, chunk_sql in RECOMPUTE_CHUNK_SQL.items():
+        cur.execute(f"SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM {table}")
+        low, high = cur.fetchone()
+        conn.commit()
+
+        updated = 0
+        for chunk_start in range(low, high + 1, args.chunk):
+            cur.execute(chunk_sql, (chunk_start, chunk_start + args.chunk))
+            updated += cur.fetchone()[0]
+            conn.commit()
+            if args.pause:
+                time.sleep(args.pause)
+        report[table] = {'updated': updated, 'id_range': [low, high]}
+
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    print(json.dumps(report))
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+'''Сверка счётчиков корзин рейтинга с фактическим опытом питомцев
+
+Обработчик поддерживает leaderboard_buckets инкрементально; скрипт пересчитывает корзины
+диапазонами по диапазону индекса idx_pets_xp и исправляет только разошедшиеся строки
+(например, после ручных правок опыта или удаления игроков). Корзины диапазона
+блокируются на время пересчёта, поэтому параллельные действия ждут не дольше одной порции.
+
+    DATABASE_URL=... python scripts/reconcile_leaderboard.py --chunk 50
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend', 'pet'))
+
+from leaderboard import BUCKET_WIDTH, RECONCILE_LOCK_SQL, RECONCILE_SQL  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chunk', type=int, default=50, help='корзин на одну транзакцию')
+    parser.add_argument('--pause', type=float, default=0.0, help='пауза между порциями, секунды')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT GREATEST(COALESCE((SELECT MAX(xp) FROM pets), 0) / %s, "
+        "COALESCE((SELECT MAX(bucket) FROM leaderboard_buckets), 0))",
+        (BUCKET_WIDTH,)
+    )
+    top_bucket = cur.fetchone()[0]
+    conn.commit()
+
+    started = time.perf_counter()
+    fixed = 0
+    removed = 0
+    for low in range(0, top_bucket + 1, args.chunk):
+        bounds = {'low': low, 'high': low + args.chunk}
+        cur.execute(RECONCILE_LOCK_SQL, bounds)
+        cur.execute(RECONCILE_SQL, bounds)
+        chunk_fixed, chunk_removed = cur.fetchone()
+        fixed += chunk_fixed
+        removed += chunk_removed
+        conn.commit()
+        if args.pause:
+            time.sleep(args.pause)
+
+    print(json.dumps({
+        'buckets': top_bucket + 1,
+        'fixed': fixed,
+        'removed': removed,
+        'seconds': round(time.perf_counter() - started, 2)
+    }))
+    cur.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+'''Все функции в одном процессе: HTTP-сервер на asyncio для локального и on-prem запуска
+
+Поднимает pet, trade, auth и unisender за одним портом: запрос /pet?user_id=1
+превращается в событие облачной функции и передаётся в тот же handler(event, context).
+Обработчики синхронные (psycopg2, requests), поэтому выполняются в ограниченном пуле
+потоков, а цикл событий держит соединения клиентов и ничего не блокирует. Если
+запросов в работе больше --max-pending, сервер сразу отвечает 503.
+
+Модули функций загружаются изолированно: одноимённые модули с разным содержимым
+остаются у своих функций, а побайтно одинаковые копии (db.py, timing.py, tokens.py)
+загружаются один раз. Поэтому у всех функций общий пул соединений с базой размером
+с пул потоков, общий кэш отозванных токенов и один счётчик холодного старта.
+
+GET /events?user_id=...&token=... — поток Server-Sent Events с уведомлениями NOTIFY,
+которые пишут pet и trade (новое состояние питомца, закрытые квесты, продажа
+предложения). Все потоки процесса обслуживает одно соединение LISTEN.
+
+SIGINT/SIGTERM: сервер перестаёт принимать соединения, ждёт запросы в работе до
+--grace секунд, останавливает потоки и закрывает соединения с базой.
+
+    DATABASE_URL=... SESSION_SECRET=... python scripts/serve.py --port 8080 --threads 32
+'''
+
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import signal
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, urlsplit
+
+from live_updates import NotificationHub
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND = os.path.join(ROOT, 'backend')
+
+FUNCTIONS = {
+    'pet': os.path.join(BACKEND, 'pet'),
+    'trade': os.path.join(BACKEND, 'trade'),
+    'auth': os.path.join(BACKEND, 'auth'),
+    'unisender': os.path.join(BACKEND, 'extensions', 'unisender-go', 'unisender')
+}
+
+# Имена из func2url.json, под которыми функции известны фронтенду
+ALIASES = {'unisender-go-unisender': 'unisender'}
+
+MAX_BODY = 1024 * 1024
+MAX_HEADERS = 64 * 1024
+KEEP_ALIVE_TIMEOUT = 15.0
+SSE_HEARTBEAT = 15.0
+
+REASONS = {
+    200: 'OK', 202: 'Accepted', 204: 'No Content', 304: 'Not Modified', 400: 'Bad Request',
+    401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+    409: 'Conflict', 413: 'Payload Too Large', 422: 'Unprocessable Entity', 429: 'Too Many Requests',
+    500: 'Internal Server Error', 502: 'Bad Gateway', 503: 'Service Unavailable'
+}
+
+
+def load_functions(functions: dict) -> tuple:
+    '''Импортирует index.py каждой функции; одинаковые по содержимому модули общие
+
+    Возвращает ({имя: handler}, {имя модуля: модуль} общих модулей).
+    '''
+    shared = {}
+    digests = {}
+    handlers = {}
+    for name, function_dir in functions.items():
+        siblings = {}
+        for filename in os.listdir(function_dir):
+            if filename.endswith('.py'):
+                with open(os.path.join(function_dir, filename), 'rb') as source:
+                    siblings[filename[:-3]] = hashlib.sha256(source.read()).hexdigest()
+        for module_name, digest in siblings.items():
+            sys.modules.pop(module_name, None)
+            if digests.get(module_name) == digest:
+                sys.modules[module_name] = shared[module_name]
+        sys.path.insert(0, function_dir)
+        try:
+            handlers[name] = importlib.import_module('index').handler
+            for module_name, digest in siblings.items():
+                if module_name != 'index' and module_name in sys.modules and module_name not in digests:
+                    digests[module_name] = digest
+                    shared[module_name] = sys.modules[module_name]
+        finally:
+            sys.path.remove(function_dir)
+            for module_name in siblings:
+                sys.modules.pop(module_name, None)
+    return handlers, shared
+
+
+class Server:
+    def __init__(self, handlers: dict, threads: int, max_pending: int, hub: NotificationHub = None, authenticate=None):
+        self.handlers = handlers
+        self.hub = hub
+        self.authenticate = authenticate
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='handler')
+        self.max_pending = max_pending
+        self.pending = 0
+        self.connections = set()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.stopping = False
+
+    async def serve_connection(self, reader, writer) -> None:
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while not self.stopping:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError as e:
+                    status = 413 if 'large' in str(e) else 400
+                    await write_response(writer, status, {'Content-Type': 'application/json'}, json.dumps({'error': str(e)}), False)
+                    break
+                if request is None:
+                    break
+                if self.hub is not None and urlsplit(request['target']).path.rstrip('/') == '/events':
+                    await self.stream_events(request, writer)
+                    break
+                keep_alive = request['keep_alive'] and not self.stopping
+                status, headers, body = await self.dispatch(request)
+                await write_response(writer, status, headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            # Отмена приходит только от drain при остановке
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def dispatch(self, request: dict) -> tuple:
+        parts = urlsplit(request['target'])
+        segments = [segment for segment in parts.path.split('/') if segment]
+        name = ALIASES.get(segments[0], segments[0]) if segments else None
+        handler = self.handlers.get(name)
+        if handler is None:
+            return 404, {'Content-Type': 'application/json'}, json.dumps({'error': 'Unknown function'})
+        if self.pending >= self.max_pending:
+            return 503, {'Content-Type': 'application/json', 'Retry-After': '1'}, json.dumps({'error': 'Server busy'})
+
+        event = {
+            'httpMethod': request['method'],
+            'path': '/' + '/'.join(segments[1:]),
+            'headers': request['headers'],
+            'queryStringParameters': dict(parse_qsl(parts.query, keep_blank_values=True)),
+            'body': request['body'].decode('utf-8', errors='replace'),
+            'isBase64Encoded': False,
+            'requestContext': {'requestId': uuid.uuid4().hex, 'requestTimeEpoch': int(time.time() * 1000)}
+        }
+        context = SimpleNamespace(request_id=event['requestContext']['requestId'], function_name=name)
+
+        self.pending += 1
+        self.idle.clear()
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(self.executor, handler, event, context)
+        except Exception as e:
+            return 500, {'Content-Type': 'application/json'}, json.dumps({'error': f'Handler failed: {e}'})
+        finally:
+            self.pending -= 1
+            if not self.pending:
+                self.idle.set()
+        return response.get('statusCode', 200), response.get('headers') or {}, response.get('body') or ''
+
+    async def stream_events(self, request: dict, writer) -> None:
+        params = dict(parse_qsl(urlsplit(request['target']).query))
+        headers = {key.lower(): value for key, value in request['headers'].items()}
+        # EventSource не умеет задавать заголовки, поэтому токен можно передать в запросе
+        authorization = headers.get('authorization') or (f"Bearer {params['token']}" if params.get('token') else None)
+        user_id, auth_error = self.authenticate(authorization, params.get('user_id'), None)
+        if auth_error or not user_id:
+            status, error = auth_error or (400, 'user_id обязателен')
+            cors = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+            await write_response(writer, status, cors, json.dumps({'error': error}), False)
+            return
+
+        writer.write(
+            b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+            b'Access-Control-Allow-Origin: *\r\nX-Accel-Buffering: no\r\nConnection: close\r\n\r\n'
+            b'retry: 3000\n\n'
+        )
+        await writer.drain()
+        queue = self.hub.subscribe(user_id)
+        try:
+            while not self.stopping:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    writer.write(b': ping\n\n')
+                else:
+                    kind = json.loads(payload).get('t', 'message')
+                    writer.write(f'event: {kind}\ndata: {payload}\n\n'.encode())
+                await writer.drain()
+        finally:
+            self.hub.unsubscribe(user_id, queue)
+
+    async def drain(self, grace: float) -> None:
+        self.stopping = True
+        try:
+            await asyncio.wait_for(self.idle.wait(), grace)
+        except asyncio.TimeoutError:
+            pass
+        # Соединения, ждущие следующего запроса keep-alive, закрываем сразу
+        tasks = list(self.connections)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+
+
+async def read_request(reader) -> dict:
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise ValueError('Headers too large')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ', 2)
+    except ValueError:
+        raise ValueError('Malformed request line')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip()] = value.strip()
+    lowered = {key.lower(): value for key, value in headers.items()}
+    if lowered.get('transfer-encoding', '').lower() == 'chunked':
+        raise ValueError('Chunked bodies are not supported')
+    length = int(lowered.get('content-length') or 0)
+    if length > MAX_BODY:
+        raise ValueError('Body too large')
+    body = await reader.readexactly(length) if length else b''
+    connection = lowered.get('connection', '').lower()
+    keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+    return {'method': method.upper(), 'target': target, 'headers': headers, 'body': body, 'keep_alive': keep_alive}
+
+
+async def write_response(writer, status: int, headers: dict, body, keep_alive: bool) -> None:
+    raw = body.encode() if isinstance(body, str) else (body or b'')
+    lines = [f'HTTP/1.1 {status} {REASONS.get(status, "Unknown")}']
+    for key, value in headers.items():
+        if key.lower() not in ('content-length', 'connection'):
+            lines.append(f'{key}: {value}')
+    lines.append(f'Content-Length: {len(raw)}')
+    lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', errors='replace') + raw)
+    await writer.drain()
+
+
+async def run(args) -> None:
+    handlers, shared = load_functions({name: FUNCTIONS[name] for name in args.functions.split(',')})
+    hub = None
+    if 'notify' in shared and 'tokens' in shared and not args.no_events:
+        hub = NotificationHub(shared['notify'].CHANNEL)
+        hub_task = asyncio.create_task(hub.run())
+    server = Server(handlers, args.threads, args.max_pending, hub, shared['tokens'].authenticate if hub else None)
+    listener = await asyncio.start_server(server.serve_connection, args.host, args.port, limit=MAX_HEADERS)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    print(json.dumps({
+        'event': 'listening',
+        'url': f'http://{args.host}:{args.port}',
+        'functions': sorted(handlers),
+        'shared_modules': sorted(shared),
+        'threads': args.threads,
+        'events': hub is not None
+    }), flush=True)
+    await stop.wait()
+
+    started = time.perf_counter()
+    listener.close()
+    await server.drain(args.grace)
+    await listener.wait_closed()
+    if hub is not None:
+        hub.stop()
+        await hub_task
+    if 'db' in shared:
+        shared['db'].pool.closeall()
+    print(json.dumps({
+        'event': 'stopped',
+        'pending': server.pending,
+        'seconds': round(time.perf_counter() - started, 2)
+    }), flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--threads', type=int, default=16, help='потоков для обработчиков и соединений с базой')
+    parser.add_argument('--max-pending', type=int, default=1024, help='запросов в работе, после которых ответ 503')
+    parser.add_argument('--grace', type=float, default=20.0, help='сколько ждать запросы в работе при остановке, секунды')
+    parser.add_argument('--no-events', action='store_true', help='не поднимать /events и соединение LISTEN')
+    parser.add_argument('--functions', default=','.join(FUNCTIONS), help='какие функции поднять, через запятую')
+    args = parser.parse_args()
+
+    # Пул соединений читает размер при импорте: по соединению на поток
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.threads))
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''Локальная заглушка Unisender Go для офлайн-проверки рассылок
+
+Отвечает на POST /email/send.json как настоящее API: проверяет X-API-KEY и лимит
+получателей, выдаёт job_id и возвращает failed_emails для адресов из --fail-domain
+(по умолчанию fail.test). Соединения держатся открытыми (HTTP/1.1), а в лог пишется,
+сколько запросов пришло по каждому соединению, — так видно переиспользование
+requests.Session в обработчике.
+
+    python scripts/unisender_stub.py --port 8025
+    UNISENDER_GO_API_URL=http://127.0.0.1:8025 UNISENDER_API_KEY=test ...
+'''
+
+import argparse
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MAX_RECIPIENTS = 500
+
+_stats = {'connections': 0, 'requests': 0, 'recipients': 0}
+_lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fail_domain = 'fail.test'
+    latency = 0.0
+
+    def setup(self):
+        super().setup()
+        self.served = 0
+        with _lock:
+            _stats['connections'] += 1
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        self.served += 1
+
+        if not self.headers.get('X-API-KEY'):
+            return self.reply(401, {'status': 'error', 'code': 102, 'message': 'API key missing'})
+        if self.path.rstrip('/').split('/')[-1] != 'send.json':
+            return self.reply(404, {'status': 'error', 'code': 404, 'message': 'Unknown method'})
+
+        recipients = payload.get('message', {}).get('recipients') or []
+        if not recipients or len(recipients) > MAX_RECIPIENTS:
+            return self.reply(400, {
+                'status': 'error', 'code': 204, 'message': f'From 1 to {MAX_RECIPIENTS} recipients allowed'
+            })
+
+        if self.latency:
+            threading.Event().wait(self.latency)
+
+        emails, failed = [], {}
+        for recipient in recipients:
+            email = recipient.get('email', '')
+            if email.endswith('@' + self.fail_domain):
+                failed[email] = 'temporary_unavailable'
+            else:
+                emails.append(email)
+        with _lock:
+            _stats['requests'] += 1
+            _stats['recipients'] += len(recipients)
+        self.reply(200, {'status': 'success', 'job_id': uuid.uuid4().hex, 'emails': emails, 'failed_emails': failed})
+
+    def reply(self, status: int, body: dict) -> None:
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def finish(self):
+        super().finish()
+        print(json.dumps({'event': 'connection_closed', 'requests': self.served, **_stats}))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--fail-domain', default='fail.test', help='адреса этого домена возвращаются в failed_emails')
+    parser.add_argument('--latency', type=float, default=0.0, help='искусственная задержка ответа, секунды')
+    args = parser.parse_args()
+
+    StubHandler.fail_domain = args.fail_domain
+    StubHandler.latency = args.latency
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(json.dumps({'event': 'listening', 'url': f'http://{args.host}:{args.port}'}))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -38,6 +38,8 @@ interface SendTestParams {
 interface SendResult {
   success: boolean;
   job_id?: string;
+  /** Outbox row id when the email was queued instead of sent right away */
+  outbox_id?: number;
   error?: string;
 }
 
@@ -81,7 +83,7 @@ export function useUnisender({ apiUrl }: UseUnisenderConfig): UseUnisenderReturn
           return { success: false, error: data.error };
         }
 
-        return { success: true, job_id: data.job_id };
+        return { success: true, job_id: data.job_id, outbox_id: data.outbox_id };
       } catch (err) {
         const message = err instanceof Error ? err.message : "Network error";
         setError(message);
@@ -112,7 +114,7 @@ export function useUnisender({ apiUrl }: UseUnisenderConfig): UseUnisenderReturn
           return { success: false, error: data.error };
         }
 
-        return { success: true, job_id: data.job_id };
+        return { success: true, job_id: data.job_id, outbox_id: data.outbox_id };
       } catch (err) {
         const message = err instanceof Error ? err.message : "Network error";
         setError(message);
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { Card } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Progress } from '@/components/ui/progress';
@@ -13,6 +13,13 @@ import { useToast } from '@/hooks/use-toast';
 const AUTH_URL = 'https://functions.poehali.dev/c60db1a5-4bb2-415d-b418-0a4603b72822';
 const PET_URL = 'https://functions.poehali.dev/5ab16b82-ac41-4602-96f8-9efdb2ecdb1b';
 const TRADE_URL = 'https://functions.poehali.dev/750b5986-c508-4f18-b3d3-9de01b82d2d6';
+// Поток SSE из scripts/serve.py; без него состояние обновляется запросами как раньше
+const EVENTS_URL: string | undefined = import.meta.env.VITE_EVENTS_URL;
+
+const authHeaders = (): Record<string, string> => {
+  const token = localStorage.getItem('tamagotchi_token');
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
 
 const Index = () => {
   const { toast } = useToast();
@@ -23,6 +30,20 @@ const Index = () => {
   const [tradeOffers, setTradeOffers] = useState<any[]>([]);
   const [showTradeDialog, setShowTradeDialog] = useState(false);
   const [selectedItem, setSelectedItem] = useState<any>(null);
+  const petEtag = useRef<string | null>(null);
+
+  // 401 на запросе с токеном: токен истёк, отозван или выдан до подписанных сессий
+  const apiFetch = async (input: string, init?: RequestInit) => {
+    const response = await fetch(input, init);
+    if (response.status === 401 && localStorage.getItem('tamagotchi_token')) {
+      localStorage.removeItem('tamagotchi_user');
+      localStorage.removeItem('tamagotchi_token');
+      setShowAuth(true);
+      setUser(null);
+      throw new Error('Сессия истекла, войдите снова');
+    }
+    return response;
+  };
   
   const [authForm, setAuthForm] = useState({
     email: '',
@@ -79,9 +100,45 @@ const Index = () => {
     }
   }, [user, activeTab]);
 
+  useEffect(() => {
+    if (!user || !EVENTS_URL) return;
+    const token = localStorage.getItem('tamagotchi_token');
+    const params = new URLSearchParams({ user_id: String(user.id), ...(token ? { token } : {}) });
+    const source = new EventSource(`${EVENTS_URL}?${params}`);
+
+    source.addEventListener('pet', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      petEtag.current = null;
+      setPetStats(prev => ({
+        ...prev,
+        ...data.pet,
+        xpToNext: data.pet.xp + (data.xp_to_next ?? 0),
+        coins: prev.coins + (data.reward ?? 0)
+      }));
+      if (data.quests) {
+        toast({ title: '🏆 Квест выполнен!', description: `${data.quests.join(', ')}: +${data.reward} монет` });
+      }
+    });
+    source.addEventListener('sold', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      setPetStats(prev => ({ ...prev, coins: data.coins ?? prev.coins + data.price }));
+      setTradeOffers(prev => prev.filter(offer => offer.id !== data.offer_id));
+      toast({ title: '💰 Предмет продан!', description: `${data.item_name} за ${data.price} монет` });
+    });
+
+    return () => source.close();
+  }, [user]);
+
   const loadPetData = async (userId: number) => {
     try {
-      const response = await fetch(`${PET_URL}?user_id=${userId}`);
+      const response = await apiFetch(`${PET_URL}?user_id=${userId}`, {
+        headers: {
+          ...authHeaders(),
+          ...(petEtag.current ? { 'If-None-Match': petEtag.current } : {})
+        }
+      });
+      if (response.status === 304) return;
+      petEtag.current = response.headers.get('ETag');
       const data = await response.json();
       
       if (data.pet) {
@@ -91,9 +148,9 @@ const Index = () => {
           health: data.pet.health,
           energy: data.pet.energy,
           coins: data.user.coins,
-          level: data.user.level,
-          xp: data.user.xp,
-          xpToNext: 600
+          level: data.pet.level,
+          xp: data.pet.xp,
+          xpToNext: data.pet.xp + (data.pet.xp_to_next ?? 0)
         });
       }
       
@@ -137,7 +194,7 @@ const Index = () => {
 
   const loadTradeOffers = async () => {
     try {
-      const response = await fetch(`${TRADE_URL}?user_id=${user.id}`);
+      const response = await apiFetch(`${TRADE_URL}?user_id=${user.id}`, { headers: authHeaders() });
       const data = await response.json();
       if (data.offers) {
         setTradeOffers(data.offers);
@@ -193,9 +250,9 @@ const Index = () => {
     }
     
     try {
-      const response = await fetch(PET_URL, {
+      const response = await apiFetch(PET_URL, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({ action: 'feed', user_id: user.id })
       });
       const data = await response.json();
@@ -204,7 +261,9 @@ const Index = () => {
         ...prev,
         hunger: data.hunger,
         happiness: data.happiness,
-        xp: data.xp
+        xp: data.xp,
+        level: data.level,
+        xpToNext: data.xp + (data.xp_to_next ?? 0)
       }));
       toast({ title: '🍎 Ням-ням!', description: '+20 сытости, +5 счастья' });
     } catch (error) {
@@ -220,9 +279,9 @@ const Index = () => {
     }
     
     try {
-      const response = await fetch(PET_URL, {
+      const response = await apiFetch(PET_URL, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({ action: 'play', user_id: user.id })
       });
       const data = await response.json();
@@ -231,7 +290,9 @@ const Index = () => {
         ...prev,
         happiness: data.happiness,
         energy: data.energy,
-        xp: data.xp
+        xp: data.xp,
+        level: data.level,
+        xpToNext: data.xp + (data.xp_to_next ?? 0)
       }));
       toast({ title: '🎮 Весело!', description: '+25 счастья, -15 энергии' });
     } catch (error) {
@@ -247,9 +308,9 @@ const Index = () => {
     }
     
     try {
-      const response = await fetch(PET_URL, {
+      const response = await apiFetch(PET_URL, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({ action: 'heal', user_id: user.id })
       });
       const data = await response.json();
@@ -257,7 +318,9 @@ const Index = () => {
       setPetStats(prev => ({
         ...prev,
         health: data.health,
-        xp: data.xp
+        xp: data.xp,
+        level: data.level,
+        xpToNext: data.xp + (data.xp_to_next ?? 0)
       }));
       toast({ title: '💊 Лечение!', description: '+30 здоровья' });
     } catch (error) {
@@ -269,9 +332,9 @@ const Index = () => {
     if (!user) return;
     
     try {
-      const response = await fetch(PET_URL, {
+      const response = await apiFetch(PET_URL, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({ action: 'rest', user_id: user.id })
       });
       const data = await response.json();
@@ -279,7 +342,9 @@ const Index = () => {
       setPetStats(prev => ({
         ...prev,
         energy: data.energy,
-        xp: data.xp
+        xp: data.xp,
+        level: data.level,
+        xpToNext: data.xp + (data.xp_to_next ?? 0)
       }));
       toast({ title: '😴 Отдых!', description: '+40 энергии' });
     } catch (error) {
@@ -301,9 +366,9 @@ const Index = () => {
     if (!user || !selectedItem) return;
     
     try {
-      const response = await fetch(TRADE_URL, {
+      const response = await apiFetch(TRADE_URL, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({
           action: 'create_offer',
           user_id: user.id,
@@ -332,9 +397,9 @@ const Index = () => {
     if (!user) return;
     
     try {
-      const response = await fetch(TRADE_URL, {
+      const response = await apiFetch(TRADE_URL, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({
           action: 'buy',
           user_id: user.id,
@@ -443,6 +508,11 @@ const Index = () => {
             <p className="text-gray-600">Заботься о своём виртуальном друге</p>
           </div>
           <Button variant="outline" onClick={() => {
+            fetch(AUTH_URL, {
+              method: 'POST',
+              headers: { 'Content-Type': 'application/json', ...authHeaders() },
+              body: JSON.stringify({ action: 'logout' })
+            }).catch(() => {});
             localStorage.removeItem('tamagotchi_user');
             localStorage.removeItem('tamagotchi_token');
             setShowAuth(true);